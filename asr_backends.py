@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+
+from speech2text import SAMPLE_RATE, SAMPLE_WIDTH, recognize_pcm
+
+
+class ASRBackend(ABC):
+    name = None
+    streaming = False
+
+    @abstractmethod
+    def open_stream(self):
+        pass
+
+
+class GoogleBackend(ASRBackend):
+    name = "google"
+
+    class Stream:
+        def __init__(self):
+            self.chunks = []
+
+        def accept(self, chunk):
+            self.chunks.append(chunk)
+            return None
+
+        def finish(self):
+            return recognize_pcm(b"".join(self.chunks))
+
+    def open_stream(self):
+        return self.Stream()
+
+
+class VoskBackend(ASRBackend):
+    name = "vosk"
+    streaming = True
+
+    def __init__(self, model_path=None):
+        try:
+            import vosk
+        except ImportError as e:
+            raise RuntimeError("Для офлайн-распознавания установите пакет vosk") from e
+        self._vosk = vosk
+        self.model = vosk.Model(model_path or os.getenv("VOSK_MODEL_PATH", "vosk-model-small-ru"))
+
+    class Stream:
+        def __init__(self, recognizer):
+            self.recognizer = recognizer
+            self.phrases = []
+
+        def accept(self, chunk):
+            if self.recognizer.AcceptWaveform(chunk):
+                text = json.loads(self.recognizer.Result()).get("text", "")
+                if text:
+                    self.phrases.append(text)
+                return " ".join(self.phrases)
+            partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+            return " ".join(self.phrases + [partial]) if partial else " ".join(self.phrases)
+
+        def finish(self):
+            text = json.loads(self.recognizer.FinalResult()).get("text", "")
+            if text:
+                self.phrases.append(text)
+            return " ".join(self.phrases) or None
+
+    def open_stream(self):
+        return self.Stream(self._vosk.KaldiRecognizer(self.model, SAMPLE_RATE))
+
+
+class StubBackend(ASRBackend):
+    name = "stub"
+    streaming = True
+
+    def __init__(self, text=None, delay=None):
+        self.text = text or os.getenv("ASR_STUB_TEXT", "Поставь задачу посмотреть фильм на 10 февраля")
+        self.delay = delay if delay is not None else float(os.getenv("ASR_STUB_DELAY", "0"))
+
+    class Stream:
+        def __init__(self, words, delay):
+            self.words = words
+            self.delay = delay
+            self.samples = 0
+
+        def accept(self, chunk):
+            self.samples += len(chunk) // SAMPLE_WIDTH
+            seconds = self.samples // SAMPLE_RATE
+            return " ".join(self.words[:seconds])
+
+        def finish(self):
+            if self.delay:
+                time.sleep(self.delay)
+            return " ".join(self.words) if self.samples else None
+
+    def open_stream(self):
+        return self.Stream(self.text.split(), self.delay)
+
+
+BACKENDS = {
+    GoogleBackend.name: GoogleBackend,
+    VoskBackend.name: VoskBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def get_backend(name=None):
+    name = name or os.getenv("ASR_BACKEND", GoogleBackend.name)
+    if name not in BACKENDS:
+        logging.error(f"Неизвестный ASR-бэкенд {name}, используется {GoogleBackend.name}")
+        name = GoogleBackend.name
+    return BACKENDS[name]()
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from asr_backends import get_backend
+from metrics import asr_seconds
+from speech2text import convert_ogg_to_pcm, recognize_stream
+
+
+class ASRQueueFull(Exception):
+    pass
+
+
+class ASRJobInProgress(Exception):
+    pass
+
+
+class ASRPool:
+    def __init__(self, workers=None, max_queue=50, convert_processes=None, backend=None):
+        self.workers = workers or int(os.getenv("ASR_WORKERS", "2"))
+        self.max_queue = max_queue
+        self.convert_processes = convert_processes or self.workers
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.deduplicated = 0
+        self.queue_wait = deque(maxlen=1000)
+        self.latency = deque(maxlen=1000)
+        self.backend = backend
+        self._queue = None
+        self._tasks = []
+        self._in_flight = {}
+        self._process_pool = None
+        self._thread_pool = None
+
+    def _start(self):
+        if self.backend is None:
+            self.backend = get_backend()
+        self._queue = asyncio.Queue(self.max_queue)
+        self._process_pool = ProcessPoolExecutor(self.convert_processes,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        self._thread_pool = ThreadPoolExecutor(self.workers, thread_name_prefix="asr")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, user_id, ogg_data, on_partial=None):
+        if self._queue is None:
+            self._start()
+        if user_id in self._in_flight:
+            self.deduplicated += 1
+            raise ASRJobInProgress(f"Голосовое сообщение пользователя {user_id} уже обрабатывается")
+        if self._queue.full():
+            self.rejected += 1
+            raise ASRQueueFull("Очередь распознавания переполнена")
+        future = asyncio.get_running_loop().create_future()
+        position = max(0, len(self._in_flight) - self.workers + 1)
+        self._queue.put_nowait((user_id, ogg_data, on_partial, future, time.monotonic()))
+        self._in_flight[user_id] = future
+        self.submitted += 1
+        return future, position
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            user_id, ogg_data, on_partial, future, queued_at = await self._queue.get()
+            started_at = time.monotonic()
+            self.queue_wait.append(started_at - queued_at)
+            asr_seconds.observe(started_at - queued_at, stage="queue")
+            try:
+                if self.backend.streaming:
+                    with asr_seconds.time(stage="stream"):
+                        text = await loop.run_in_executor(self._thread_pool, recognize_stream, ogg_data, self.backend,
+                                                          self._partial_callback(loop, on_partial))
+                else:
+                    with asr_seconds.time(stage="convert"):
+                        pcm_data = await loop.run_in_executor(self._process_pool, convert_ogg_to_pcm, ogg_data)
+                    with asr_seconds.time(stage="recognize"):
+                        text = await loop.run_in_executor(self._thread_pool, self._recognize_pcm, pcm_data)
+                self.completed += 1
+                if not future.done():
+                    future.set_result(text)
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Ошибка распознавания голосового сообщения: {e}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.latency.append(time.monotonic() - queued_at)
+                self._in_flight.pop(user_id, None)
+                self._queue.task_done()
+
+    def _recognize_pcm(self, pcm_data):
+        stream = self.backend.open_stream()
+        stream.accept(pcm_data)
+        return stream.finish()
+
+    @staticmethod
+    def _partial_callback(loop, on_partial):
+        if on_partial is None:
+            return None
+
+        def callback(text):
+            loop.call_soon_threadsafe(lambda: asyncio.ensure_future(on_partial(text)))
+
+        return callback
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": len(self._in_flight),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "deduplicated": self.deduplicated,
+            "queue_wait_avg": sum(self.queue_wait) / len(self.queue_wait) if self.queue_wait else 0.0,
+            "latency_avg": sum(self.latency) / len(self.latency) if self.latency else 0.0,
+            "latency_max": max(self.latency, default=0.0),
+        }
+
+    async def close(self):
+        for worker in self._tasks:
+            worker.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._process_pool is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda pool=self._process_pool: pool.shutdown(wait=True, cancel_futures=True))
+            self._process_pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+        self._queue = None
@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+SIZES = (10, 1_000, 100_000)
+TASKS_PER_DAY = 6
+WALKBACK_DAYS = 14
+
+
+class StubBot:
+    async def send_message(self, chat_id, text, **kwargs):
+        return None
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        return None
+
+    async def delete_message(self, chat_id, message_id):
+        return True
+
+
+class StubState:
+    def __init__(self, data):
+        self.data = dict(data)
+
+    async def get_data(self):
+        return dict(self.data)
+
+    async def finish(self):
+        self.data = {}
+
+
+class StubMessage:
+    def __init__(self, user_id, text):
+        self.text = text
+        self.from_user = types.SimpleNamespace(id=user_id)
+        self.chat = types.SimpleNamespace(id=user_id)
+        self.message_id = 0
+
+
+def populate(sizes, today):
+    import main
+    from slots import day_bounds, format_scheduled_time
+
+    rows = []
+    for user_id in sizes:
+        for i in range(user_id):
+            day = today - datetime.timedelta(days=i // TASKS_PER_DAY)
+            day_start, _ = day_bounds(day)
+            start = day_start + 9 * 60 + (i % TASKS_PER_DAY) * 90
+            rows.append((user_id, f"задача {i}", day.strftime("%Y-%m-%d"), format_scheduled_time(start, start + 60),
+                         start, start + 60, i % 3 == 0))
+        for offset in range(1, WALKBACK_DAYS + 1):
+            day = today + datetime.timedelta(days=offset)
+            day_start, _ = day_bounds(day)
+            rows.append((user_id, "весь день", day.strftime("%Y-%m-%d"),
+                         format_scheduled_time(day_start, day_start + 24 * 60 - 1), day_start, day_start + 24 * 60 - 1, 0))
+    conn = main.db.connect()
+    conn.executemany("""
+        INSERT INTO tasks (user_id, name, execution_date, scheduled_time, start_at, end_at, completed)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+async def measure(fn, reps, warmup=3):
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    for _ in range(reps):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "mean_ms": statistics.fmean(samples),
+        "reps": reps,
+    }
+
+
+async def run_benchmarks(sizes, reps):
+    import couples
+    import main
+    from outbox import Outbox
+
+    main.outbox = Outbox(StubBot(), global_rate=1e9, chat_rate=1e9, chat_burst=1e9)
+    today = datetime.date.today()
+    results = {}
+
+    async def couples_lookup():
+        couples.get_couples()
+
+    results["get_couples"] = await measure(couples_lookup, reps * 10)
+
+    async def calendar_skeleton():
+        main.generate_calendar_markup(today.year, today.month)
+
+    results["calendar_markup"] = await measure(calendar_skeleton, reps)
+
+    for user_id in sizes:
+        target = today - datetime.timedelta(days=1)
+
+        async def find_slot():
+            await main.find_available_time(user_id, target, 60)
+
+        async def find_slot_walkback():
+            await main.find_available_time(user_id, today + datetime.timedelta(days=WALKBACK_DAYS), 60)
+
+        async def day_view():
+            main.day_view_cache.invalidate(user_id, today.strftime("%Y-%m-%d"))
+            await main.render_day_view(user_id, today)
+
+        async def month_calendar():
+            counts = await main.load_month_counts(user_id, today.year, today.month)
+            main.generate_calendar_markup(today.year, today.month, counts)
+
+        shift = {"minutes": 30}
+
+        async def cascade_shift():
+            row = await main.db.fetchone("""
+                SELECT id, start_at, end_at FROM tasks WHERE user_id = ? AND execution_date = ? ORDER BY start_at LIMIT 1
+            """, (user_id, today.strftime("%Y-%m-%d")))
+            task_id, start_at, end_at = row
+            old_start, old_end = main.from_minutes(start_at), main.from_minutes(end_at)
+            new_start = old_start + datetime.timedelta(minutes=shift["minutes"])
+            shift["minutes"] = -shift["minutes"]
+            state = StubState({"edit_task_id": task_id, "edit_year": today.year, "edit_month": today.month,
+                               "edit_day": today.day, "old_start": old_start.strftime("%Y-%m-%d %H:%M"),
+                               "old_end": old_end.strftime("%Y-%m-%d %H:%M")})
+            await main.process_new_time(StubMessage(user_id, new_start.strftime("%H:%M")), state)
+
+        for name, fn in (("find_available_time", find_slot), ("find_available_time_walkback", find_slot_walkback),
+                         ("day_view", day_view), ("month_calendar", month_calendar),
+                         ("process_new_time", cascade_shift)):
+            results[f"{name}[{user_id}]"] = await measure(fn, reps)
+    await main.outbox.close()
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:45s} {result['median_ms']:10.3f} ms   (нет в базовой линии)")
+            continue
+        change = result["median_ms"] / base["median_ms"] - 1 if base["median_ms"] else 0.0
+        flag = "РЕГРЕССИЯ" if change > threshold else ""
+        print(f"{name:45s} {result['median_ms']:10.3f} ms  {base['median_ms']:10.3f} ms  {change:+7.1%} {flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def import_breakdown(top=15):
+    code = "import json, main; print(json.dumps(main.metrics.startup_phases))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        sys.exit(1)
+    children, total = [], None
+    for line in result.stderr.splitlines():
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0:
+            if name.strip() == "main":
+                total = int(fields[1]) / 1000
+                break
+            children = []
+        elif depth == 1:
+            children.append((name.strip(), int(fields[0]) / 1000, int(fields[1]) / 1000))
+    print(f"{'import main':45s} {total:10.1f} ms")
+    for name, own, cumulative in sorted(children, key=lambda row: -row[2])[:top]:
+        print(f"  {name:43s} {cumulative:10.1f} ms  собственное {own:8.1f} ms")
+    for phase, seconds in json.loads(result.stdout.splitlines()[-1]).items():
+        print(f"{'фаза ' + phase:45s} {seconds * 1000:10.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки планировщика и отрисовки")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)))
+    parser.add_argument("--reps", type=int, default=50)
+    parser.add_argument("--save", help="сохранить результаты как базовую линию JSON")
+    parser.add_argument("--compare", help="сравнить с базовой линией JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление медианы, доля")
+    parser.add_argument("--imports", action="store_true", help="разбивка времени импорта main по модулям")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ["SCHEDULE_DB"] = os.path.join(workdir, "schedule.db")
+    os.environ["FSM_STORAGE"] = "memory"
+    os.environ.setdefault("BOT_TOKEN", "123456:" + "A" * 35)
+    os.environ["YANDEX_LLM_URL"] = "http://127.0.0.1:9"
+    os.environ["ASR_BACKEND"] = "stub"
+
+    if args.imports:
+        try:
+            import_breakdown()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return
+
+    import main as bot_main
+    import migrations
+
+    migrations.migrate(bot_main.db)
+    populate(sizes, datetime.date.today())
+    try:
+        results = asyncio.run(run_benchmarks(sizes, args.reps))
+    finally:
+        bot_main.db.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "created": datetime.datetime.now().isoformat(timespec="seconds"), "sizes": sizes},
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Регрессии выше {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        for name, result in sorted(results.items()):
+            print(f"{name:45s} {result['median_ms']:10.3f} ms  p95 {result['p95_ms']:10.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
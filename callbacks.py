@@ -0,0 +1,78 @@
+import datetime
+import logging
+
+SEPARATOR = ":"
+MAX_LENGTH = 64
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+EPOCH_DATE = datetime.date(1970, 1, 1)
+
+
+def to_base36(value):
+    if value < 0:
+        return "-" + to_base36(-value)
+    digits = ""
+    while True:
+        value, remainder = divmod(value, 36)
+        digits = DIGITS[remainder] + digits
+        if not value:
+            return digits
+
+
+def encode_value(value):
+    if isinstance(value, datetime.date):
+        return to_base36((value - EPOCH_DATE).days)
+    return to_base36(value)
+
+
+def decode_value(text, kind):
+    number = int(text, 36)
+    if kind is datetime.date:
+        return EPOCH_DATE + datetime.timedelta(days=number)
+    return number
+
+
+def pack(tag, *values):
+    data = SEPARATOR.join([tag, *(encode_value(value) for value in values)])
+    if len(data.encode()) > MAX_LENGTH:
+        raise ValueError(f"callback_data длиннее {MAX_LENGTH} байт: {data}")
+    return data
+
+
+def unpack(payload, kinds):
+    parts = payload.split(SEPARATOR) if payload else []
+    if len(parts) != len(kinds):
+        raise ValueError(f"Ожидалось {len(kinds)} полей, получено {len(parts)}")
+    return [decode_value(part, kind) for part, kind in zip(parts, kinds)]
+
+
+class CallbackRouter:
+    def __init__(self):
+        self.routes = {}
+
+    def route(self, tag, *kinds, states="*"):
+        if states != "*":
+            states = {getattr(state, "state", state) for state in states}
+
+        def decorator(handler):
+            self.routes[tag] = (handler, kinds, states)
+            return handler
+
+        return decorator
+
+    async def dispatch(self, callback_query, state):
+        tag, _, payload = callback_query.data.partition(SEPARATOR)
+        route = self.routes.get(tag)
+        if route is None:
+            await callback_query.answer()
+            return
+        handler, kinds, states = route
+        if states != "*" and await state.get_state() not in states:
+            await callback_query.answer()
+            return
+        try:
+            values = unpack(payload, kinds)
+        except ValueError as e:
+            logging.error(f"Неверные данные кнопки {callback_query.data}: {e}")
+            await callback_query.answer("Неверные данные кнопки.", show_alert=True)
+            return
+        await handler(callback_query, state, *values)
@@ -0,0 +1,102 @@
+import asyncio
+import itertools
+import json
+import sys
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import speech2text
+from db import Database
+from migrations import migrate
+
+DEFAULT_ANSWER = "Данная задача займет 45 минут. Хотите изменить?"
+
+
+class FakeYandexGPT:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.answers = {}
+        self.requests = []
+        self._operations = {}
+        self._ids = itertools.count()
+        self._server = None
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/foundationModels/v1/completion", self.complete)
+        app.router.add_post("/foundationModels/v1/completionAsync", self.complete_async)
+        app.router.add_get("/operations/{id}", self.operation)
+        return app
+
+    async def start(self):
+        self._server = TestServer(self.app())
+        await self._server.start_server()
+        return str(self._server.make_url("")).rstrip("/")
+
+    async def close(self):
+        if self._server is not None:
+            await self._server.close()
+
+    def answer(self, mode, body):
+        prompt = body["messages"][1]["text"]
+        self.requests.append((mode, prompt))
+        return self.answers.get(prompt, DEFAULT_ANSWER)
+
+    @staticmethod
+    def alternative(text, status="ALTERNATIVE_STATUS_FINAL"):
+        return {"result": {"alternatives": [{"message": {"text": text}, "status": status}]}}
+
+    async def complete(self, request):
+        body = await request.json()
+        stream = body["completionOptions"].get("stream")
+        text = self.answer("stream" if stream else "sync", body)
+        await asyncio.sleep(self.latency)
+        if not stream:
+            return web.json_response(self.alternative(text))
+        response = web.StreamResponse()
+        await response.prepare(request)
+        words = text.split(" ")
+        chunks = [self.alternative(" ".join(words[:i]), "ALTERNATIVE_STATUS_PARTIAL") for i in range(1, len(words))]
+        try:
+            for chunk in chunks + [self.alternative(text)]:
+                await response.write((json.dumps(chunk) + "\n").encode())
+        except ConnectionResetError:
+            pass
+        return response
+
+    async def complete_async(self, request):
+        operation_id = str(next(self._ids))
+        self._operations[operation_id] = (time.monotonic() + self.latency, self.answer("polling", await request.json()))
+        return web.json_response({"id": operation_id})
+
+    async def operation(self, request):
+        ready_at, text = self._operations[request.match_info["id"]]
+        if time.monotonic() < ready_at:
+            return web.json_response({"done": False})
+        return web.json_response({"done": True, "response": {"alternatives": [{"message": {"text": text}}]}})
+
+
+@pytest.fixture
+def llm():
+    return FakeYandexGPT()
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "schedule.db"))
+    migrate(database)
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    path = tmp_path / "ffmpeg"
+    path.write_text(f"#!{sys.executable}\nimport shutil, sys\nshutil.copyfileobj(sys.stdin.buffer, sys.stdout.buffer)\n")
+    path.chmod(0o755)
+    monkeypatch.setenv("FFMPEG_PATH", str(path))
+    monkeypatch.setattr(speech2text, "FFMPEG_PATH", str(path))
+    return path
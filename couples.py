@@ -1,54 +1,90 @@
+import logging
+import os
 import re
-import json
+import threading
+import time
+from pathlib import Path
 
+COUPLES_FILE = os.getenv("COUPLES_FILE", str(Path(__file__).with_name("couples.txt")))
+WEEKDAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+RELOAD_CHECK_INTERVAL = 1.0
 
-def get_couples():
-    text = """
-    **Понедельник:**
-    1. Линейная алгебра: 9:00–10:30.
-    2. Геометрия: 10:50–12:30.
-    3. Физика: 12:50–14:20.
-    4. Иностранный язык: 14:40–16:10.
-    
-    **Вторник:**
-    1. Алгоритмы и структуры данных: 9:00–10:30.
-    2. Программирование на Python: 10:50–12:30.
-    3. Основы искусственного интеллекта: 13:00–14:30.
-    4. Проектная работа: 15:00–16:30.
-    
-    **Среда:**
-    1. Математический анализ: 9:00–10:30.
-    2. Дискретная математика: 10:50–12:30.
-    3. Теория вероятностей и статистика: 13:00–14:30.
-    4. Семинар по программированию: 15:00–16:30.
-    
-    **Четверг:**
-    1. Компьютерная графика: 9:00–10:30.
-    2. Базы данных: 10:50–12:30.
-    3. Сетевые технологии: 13:00–14:30.
-    4. Робототехника и автоматизация: 15:00–16:30.
-    
-    **Пятница:**
-    1. Операционные системы: 9:00–10:30.
-    2. Безопасность информационных систем: 10:50–12:30.
-    3. Веб-разработка: 13:00–14:30.
-    4. Работа над групповым проектом: 15:00–16:30.
-    """
+DAY_PATTERN = re.compile(r"\*\*(.+?):\*\*(.*?)(?=\*\*|$)", flags=re.DOTALL)
+LESSON_PATTERN = re.compile(r"\d+\.\s*(.+?):\s*([0-9]{1,2}:[0-9]{2}–[0-9]{1,2}:[0-9]{2})\.")
+
+
+class Timetable:
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.busy = [[] for _ in WEEKDAYS]
+        self.labels = [[] for _ in WEEKDAYS]
+        for day, lessons in schedule.items():
+            if day not in WEEKDAYS:
+                logging.error(f"Неизвестный день недели в расписании: {day}")
+                continue
+            weekday = WEEKDAYS.index(day)
+            for lesson in lessons:
+                try:
+                    start_str, end_str = (part.strip() for part in lesson["time"].split("–"))
+                    self.busy[weekday].append((_to_day_minutes(start_str), _to_day_minutes(end_str)))
+                    self.labels[weekday].append(f"🔔 {lesson['subject']} ({start_str} - {end_str})")
+                except Exception as e:
+                    logging.error(f"Ошибка обработки пары: {lesson}, {e}")
+            self.busy[weekday].sort()
 
-    schedule = {}
 
-    day_pattern = r"\*\*(.+?):\*\*(.*?)(?=\*\*|$)"
-    days = re.findall(day_pattern, text, flags=re.DOTALL)
+def _to_day_minutes(time_str):
+    hours, minutes = time_str.split(":")
+    return int(hours) * 60 + int(minutes)
 
-    for day, content in days:
-        day = day.strip()
+
+def parse_couples(text):
+    schedule = {}
+    for day, content in DAY_PATTERN.findall(text):
         lessons = []
-        lesson_pattern = r"\d+\.\s*(.+?):\s*([0-9]{1,2}:[0-9]{2}–[0-9]{1,2}:[0-9]{2})\."
-        for subject, time in re.findall(lesson_pattern, content):
+        for subject, time_range in LESSON_PATTERN.findall(content):
             lessons.append({
                 "subject": subject.strip(),
-                "time": time.strip()
+                "time": time_range.strip()
             })
-        schedule[day] = lessons
-
+        schedule[day.strip()] = lessons
     return schedule
+
+
+_lock = threading.Lock()
+_timetable = None
+_mtime = None
+_checked_at = 0.0
+
+
+def get_timetable():
+    global _timetable, _mtime, _checked_at
+    now = time.monotonic()
+    if _timetable is not None and now - _checked_at < RELOAD_CHECK_INTERVAL:
+        return _timetable
+    with _lock:
+        _checked_at = now
+        try:
+            mtime = os.stat(COUPLES_FILE).st_mtime_ns
+        except OSError as e:
+            if _timetable is None:
+                logging.error(f"Не удалось прочитать расписание пар: {e}")
+                _timetable = Timetable({})
+            return _timetable
+        if _timetable is None or mtime != _mtime:
+            _mtime = mtime
+            try:
+                with open(COUPLES_FILE, encoding="utf-8") as f:
+                    timetable = Timetable(parse_couples(f.read()))
+            except (OSError, ValueError) as e:
+                logging.error(f"Не удалось прочитать расписание пар: {e}")
+                if _timetable is None:
+                    _timetable = Timetable({})
+                return _timetable
+            _timetable = timetable
+            logging.info(f"Расписание пар загружено из {COUPLES_FILE}")
+        return _timetable
+
+
+def get_couples():
+    return get_timetable().schedule
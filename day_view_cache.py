@@ -0,0 +1,42 @@
+from collections import OrderedDict
+
+
+class DayViewCache:
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+
+    def get(self, user_id, date_str, version):
+        key = (user_id, date_str)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is not version:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, user_id, date_str, version, view):
+        key = (user_id, date_str)
+        self._entries[key] = (version, view)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id, *date_strs):
+        for date_str in date_strs:
+            if date_str and self._entries.pop((user_id, date_str), None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+        }
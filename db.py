@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import db_batch_size, db_seconds, query_label
+
+
+class Database:
+    def __init__(self, path, readers=4, commit_delay=0.005, max_batch=256):
+        self.path = path
+        self.readers = readers
+        self.commit_delay = commit_delay
+        self.max_batch = max_batch
+        self.commits = 0
+        self.writes = 0
+        self._local = threading.local()
+        self._reader_pool = None
+        self._writes = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _reader_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.connect()
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+        return conn
+
+    def _ensure_started(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._reader_pool = ThreadPoolExecutor(self.readers, thread_name_prefix="db-reader")
+                self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+                self._writer.start()
+
+    def _read(self, sql, params, one):
+        cur = self._reader_connection().execute(sql, params)
+        return cur.fetchone() if one else cur.fetchall()
+
+    async def fetchall(self, sql, params=()):
+        self._ensure_started()
+        with db_seconds.time(query=query_label(sql)):
+            return await asyncio.get_running_loop().run_in_executor(self._reader_pool, self._read, sql, params, False)
+
+    async def fetchone(self, sql, params=()):
+        self._ensure_started()
+        with db_seconds.time(query=query_label(sql)):
+            return await asyncio.get_running_loop().run_in_executor(self._reader_pool, self._read, sql, params, True)
+
+    async def transaction(self, fn, label="transaction"):
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with db_seconds.time(query=label):
+            self._writes.put((fn, loop, future))
+            return await future
+
+    async def execute(self, sql, params=()):
+        return await self.transaction(lambda conn: conn.execute(sql, params).fetchall(), query_label(sql))
+
+    def _write_loop(self):
+        conn = self.connect()
+        conn.isolation_level = None
+        while True:
+            job = self._writes.get()
+            if job is None:
+                break
+            batch = [job]
+            deadline = time.monotonic() + self.commit_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    job = self._writes.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._writes.put(None)
+                    break
+                batch.append(job)
+            self._run_batch(conn, batch)
+        conn.close()
+
+    def _run_batch(self, conn, batch):
+        results = []
+        started = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, loop, future in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    results.append((loop, future, fn(conn), None))
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    results.append((loop, future, None, e))
+            conn.execute("COMMIT")
+            self.commits += 1
+            self.writes += len(batch)
+            db_seconds.observe(time.perf_counter() - started, query="commit")
+            db_batch_size.observe(len(batch))
+        except Exception as e:
+            logging.error(f"Ошибка группового коммита: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(loop, future, None, e) for fn, loop, future in batch]
+        for loop, future, result, error in results:
+            loop.call_soon_threadsafe(self._resolve, future, result, error)
+
+    @staticmethod
+    def _resolve(future, result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def stats(self):
+        return {
+            "commits": self.commits,
+            "writes": self.writes,
+            "pending_writes": self._writes.qsize(),
+        }
+
+    def close(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+        if self._reader_pool is not None:
+            self._reader_pool.shutdown(wait=True)
+            self._reader_pool = None
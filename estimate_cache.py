@@ -0,0 +1,125 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+
+def normalize_task_name(name):
+    name = re.sub(r"\s+", " ", name.strip().lower())
+    return name.strip(" .,!?;:")
+
+
+class EstimateCache:
+    def __init__(self, db, memory_size=1024, max_entries=100_000, ttl=30 * 24 * 3600, touch_batch=256):
+        self.db = db
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = OrderedDict()
+        self._touched = {}
+        self._size = None
+
+    @staticmethod
+    def make_key(task_name, prompt):
+        raw = f"{normalize_task_name(task_name)}\0{prompt}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, task_name, prompt):
+        key = self.make_key(task_name, prompt)
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            answer, created_at = entry
+            if now - created_at < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                await self._touch(key, now)
+                return answer
+            del self._memory[key]
+
+        row = await self.db.fetchone("SELECT answer, created_at FROM estimate_cache WHERE key = ?", (key,))
+        if row is None or now - row[1] >= self.ttl:
+            self.misses += 1
+            return None
+        self._remember(key, row[0], row[1])
+        self.hits += 1
+        await self._touch(key, now)
+        return row[0]
+
+    async def set(self, task_name, prompt, answer):
+        key = self.make_key(task_name, prompt)
+        now = time.time()
+        self._remember(key, answer, now)
+        if self._size is None:
+            self._size = (await self.db.fetchone("SELECT COUNT(*) FROM estimate_cache"))[0]
+        touched, self._touched = self._touched, {}
+
+        def write(conn):
+            added = conn.execute("SELECT 1 FROM estimate_cache WHERE key = ?", (key,)).fetchone() is None
+            conn.execute("""
+                INSERT OR REPLACE INTO estimate_cache (key, answer, created_at, accessed_at)
+                VALUES (?, ?, ?, ?)
+            """, (key, answer, now, now))
+            self._write_touched(conn, touched)
+            return added
+
+        if await self.db.transaction(write, "estimate_cache"):
+            self._size += 1
+        if self._size > self.max_entries:
+            removed, self._size = await self.db.transaction(lambda conn: self._evict(conn, now),
+                                                            "estimate_cache_evict")
+            self.evictions += removed
+
+    async def _touch(self, key, now):
+        self._touched[key] = now
+        if len(self._touched) >= self.touch_batch:
+            await self.flush()
+
+    async def flush(self):
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        await self.db.transaction(lambda conn: self._write_touched(conn, touched), "estimate_cache_touch")
+
+    @staticmethod
+    def _write_touched(conn, touched):
+        conn.executemany("UPDATE estimate_cache SET accessed_at = ? WHERE key = ?",
+                         [(accessed_at, key) for key, accessed_at in touched.items()])
+
+    def _remember(self, key, answer, created_at):
+        self._memory[key] = (answer, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict(self, conn, now):
+        removed = conn.execute("DELETE FROM estimate_cache WHERE created_at <= ?", (now - self.ttl,)).rowcount
+        size = conn.execute("SELECT COUNT(*) FROM estimate_cache").fetchone()[0]
+        overflow = size - self.max_entries
+        if overflow > 0:
+            conn.execute("""
+                DELETE FROM estimate_cache WHERE key IN (
+                    SELECT key FROM estimate_cache ORDER BY accessed_at LIMIT ?
+                )
+            """, (overflow,))
+            removed += overflow
+            size -= overflow
+        return removed, size
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "size": self._size or 0,
+            "pending_touches": len(self._touched),
+        }
@@ -0,0 +1,113 @@
+import json
+import os
+import time
+import typing
+
+from aiogram.dispatcher.storage import BaseStorage
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, db, ttl=24 * 3600, cleanup_interval=600):
+        self.db = db
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._cleaned_at = 0.0
+
+    async def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    async def _load(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        row = await self.db.fetchone("SELECT state, data, updated_at FROM fsm_states WHERE chat_id = ? AND user_id = ?",
+                                     (chat, user))
+        if row is None or time.time() - row[2] > self.ttl:
+            return None, {}
+        return row[0], json.loads(row[1]) if row[1] else {}
+
+    async def _modify(self, chat, user, modify):
+        chat, user = self.check_address(chat=chat, user=user)
+        now = time.time()
+        cleanup = now - self._cleaned_at > self.cleanup_interval
+        if cleanup:
+            self._cleaned_at = now
+
+        def write(conn):
+            row = conn.execute("SELECT state, data, updated_at FROM fsm_states WHERE chat_id = ? AND user_id = ?",
+                               (chat, user)).fetchone()
+            if row is None or now - row[2] > self.ttl:
+                state, data = None, {}
+            else:
+                state, data = row[0], json.loads(row[1]) if row[1] else {}
+            state, data = modify(state, data)
+            if state is None and not data:
+                conn.execute("DELETE FROM fsm_states WHERE chat_id = ? AND user_id = ?", (chat, user))
+            else:
+                conn.execute("""
+                    INSERT OR REPLACE INTO fsm_states (chat_id, user_id, state, data, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (chat, user, state, json.dumps(data, ensure_ascii=False), now))
+            if cleanup:
+                conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (now - self.ttl,))
+
+        await self.db.transaction(write, "fsm_state")
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        state, _ = await self._load(chat, user)
+        return state if state is not None else self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        _, data = await self._load(chat, user)
+        return data or (default or {})
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.AnyStr = None):
+        state = self.resolve_state(state)
+        await self._modify(chat, user, lambda old_state, data: (state, data))
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        await self._modify(chat, user, lambda state, old_data: (state, dict(data or {})))
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        updates = dict(data or {}, **kwargs)
+
+        def modify(state, old_data):
+            old_data.update(updates)
+            return state, old_data
+
+        await self._modify(chat, user, modify)
+
+    async def reset_state(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True):
+        await self._modify(chat, user, lambda state, data: (None, {} if with_data else data))
+
+
+def create_storage(db):
+    backend = os.getenv("FSM_STORAGE", "sqlite")
+    ttl = int(os.getenv("FSM_STATE_TTL", str(24 * 3600)))
+    if backend == "memory":
+        from aiogram.contrib.fsm_storage.memory import MemoryStorage
+        return MemoryStorage()
+    if backend == "redis":
+        from aiogram.contrib.fsm_storage.redis import RedisStorage2
+        return RedisStorage2(host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", "6379")),
+                             db=int(os.getenv("REDIS_DB", "0")), state_ttl=ttl, data_ttl=ttl)
+    return SQLiteStorage(db, ttl=ttl)
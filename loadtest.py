@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from aiohttp import ClientSession, web
+
+BOT_TOKEN = "123456:" + "A" * 35
+FLOWS = ("task_creation", "calendar", "toggle", "time_modification", "delete")
+REJECTIONS = ("Сейчас слишком много", "ещё обрабатывается", "Ошибка", "Не удалось")
+
+
+class Rejected(Exception):
+    pass
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class FakeBotAPI:
+    def __init__(self, latency=0.0, voice=None):
+        self.latency = latency
+        self.voice = voice
+        self.calls = {}
+        self.total_calls = 0
+        self._events = {}
+        self._message_ids = itertools.count(1000)
+
+    def app(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/file/bot{token}/{path:.*}", self.download)
+        return app
+
+    async def handle(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if request.content_type == "application/json":
+            payload = await request.json()
+        else:
+            payload = dict(await request.post())
+        method = request.match_info["method"]
+        if "reply_markup" in payload and isinstance(payload["reply_markup"], str):
+            payload["reply_markup"] = json.loads(payload["reply_markup"])
+        chat_id = int(payload["chat_id"]) if "chat_id" in payload else None
+        if method == "answerCallbackQuery":
+            chat_id = int(payload["callback_query_id"].split(":")[0])
+        result = True
+        if method == "getFile":
+            result = {"file_id": payload["file_id"], "file_unique_id": "voice", "file_size": len(self.voice or b""),
+                      "file_path": "voice/file_0.oga"}
+        elif method in ("sendMessage", "editMessageText"):
+            message_id = int(payload.get("message_id") or next(self._message_ids))
+            result = {"message_id": message_id, "date": int(time.time()), "text": payload.get("text", ""),
+                      "chat": {"id": chat_id, "type": "private"}}
+        if chat_id is not None:
+            self.calls.setdefault(chat_id, []).append((method, payload, result))
+            event = self._events.pop(chat_id, None)
+            if event is not None:
+                event.set()
+        self.total_calls += 1
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(self, request):
+        return web.Response(body=self.voice or b"")
+
+    def mark(self, chat_id):
+        return len(self.calls.get(chat_id, []))
+
+    async def wait_for(self, chat_id, since, method, text):
+        while True:
+            calls = self.calls.get(chat_id, [])
+            for call in calls[since:]:
+                if call[0] == method and text in call[1].get("text", ""):
+                    return call
+                if any(rejection in call[1].get("text", "") for rejection in REJECTIONS):
+                    raise Rejected(call[1]["text"])
+            since = len(calls)
+            event = self._events.get(chat_id)
+            if event is None:
+                event = self._events[chat_id] = asyncio.Event()
+            await event.wait()
+
+
+class FakeYandexGPT:
+    def __init__(self, latency=0.0, answer_date=None):
+        self.latency = latency
+        self.answer_date = answer_date or datetime.date.today()
+        self.requests = 0
+        self._operations = {}
+        self._ids = itertools.count()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/foundationModels/v1/completion", self.complete)
+        app.router.add_post("/foundationModels/v1/completionAsync", self.complete_async)
+        app.router.add_get("/operations/{id}", self.operation)
+        return app
+
+    def answer(self, body):
+        self.requests += 1
+        if "Задача: текст задачи" in body["messages"][0]["text"]:
+            return f"Задача: посмотреть фильм\nДата: {self.answer_date.strftime('%d-%m')}"
+        return "Данная задача займет 45 минут. Хотите изменить?"
+
+    @staticmethod
+    def alternative(text):
+        return {"result": {"alternatives": [{"message": {"text": text}, "status": "ALTERNATIVE_STATUS_FINAL"}]}}
+
+    async def complete(self, request):
+        body = await request.json()
+        await asyncio.sleep(self.latency)
+        text = self.answer(body)
+        if not body["completionOptions"].get("stream"):
+            return web.json_response(self.alternative(text))
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await response.write((json.dumps(self.alternative(text)) + "\n").encode())
+        return response
+
+    async def complete_async(self, request):
+        body = await request.json()
+        operation_id = str(next(self._ids))
+        self._operations[operation_id] = (time.monotonic() + self.latency, self.answer(body))
+        return web.json_response({"id": operation_id})
+
+    async def operation(self, request):
+        ready_at, text = self._operations[request.match_info["id"]]
+        if time.monotonic() < ready_at:
+            return web.json_response({"done": False})
+        del self._operations[request.match_info["id"]]
+        return web.json_response({"done": True, "response": {"alternatives": [{"message": {"text": text}}]}})
+
+
+class VirtualUser:
+    def __init__(self, harness, user_id):
+        self.harness = harness
+        self.user_id = user_id
+        self.markup_message = None
+
+    def _user(self):
+        return {"id": self.user_id, "is_bot": False, "first_name": f"user{self.user_id}"}
+
+    def _chat(self):
+        return {"id": self.user_id, "type": "private"}
+
+    def message_update(self, text=None, voice=False):
+        message = {"message_id": next(self.harness.message_ids), "date": int(time.time()), "chat": self._chat(),
+                   "from": self._user()}
+        if voice:
+            message["voice"] = {"file_id": f"voice{self.user_id}", "file_unique_id": "voice", "duration": 3}
+        else:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self.harness.update_ids), "message": message}
+
+    def callback_update(self, data):
+        message_id = self.markup_message[2]["message_id"] if self.markup_message else 1
+        return {"update_id": next(self.harness.update_ids), "callback_query": {
+            "id": f"{self.user_id}:{next(self.harness.update_ids)}", "chat_instance": str(self.user_id),
+            "from": self._user(), "data": data, "message": {"message_id": message_id, "date": int(time.time()), "chat": self._chat(),
+                                      "text": "..."}}}
+
+    def button(self, tag):
+        for row in (self.markup_message[1].get("reply_markup") or {}).get("inline_keyboard", []):
+            for button in row:
+                if button.get("callback_data", "").startswith(tag + ":") or button.get("callback_data") == tag:
+                    return button["callback_data"]
+        raise LookupError(f"Нет кнопки {tag}")
+
+    async def step(self, flow, update, method, text):
+        api = self.harness.api
+        since = api.mark(self.user_id)
+        started = time.perf_counter()
+        processing = await self.harness.deliver(update)
+        call = await asyncio.wait_for(api.wait_for(self.user_id, since, method, text), self.harness.timeout)
+        self.harness.record(f"{flow}/{method}", time.perf_counter() - started)
+        if "reply_markup" in call[1]:
+            self.markup_message = call
+        if processing is not None:
+            await asyncio.wait_for(asyncio.shield(processing), self.harness.timeout)
+        if self.harness.think:
+            await asyncio.sleep(self.harness.think)
+        return call
+
+    async def task_creation(self, n):
+        pack, today = self.harness.pack, datetime.date.today()
+        await self.step("task_creation", self.message_update("/addtask"), "sendMessage", "Введите название")
+        await self.step("task_creation", self.message_update(f"задача {self.user_id} {n}"), "sendMessage", "займет")
+        await self.step("task_creation", self.callback_update(pack("s")), "sendMessage", "Выберите дату")
+        await self.step("task_creation", self.callback_update(pack("d", today)), "answerCallbackQuery", "")
+
+    async def voice_creation(self, n):
+        await self.step("voice_creation", self.message_update("/voice_addtask"), "sendMessage", "голосовое")
+        await self.step("voice_creation", self.message_update(voice=True), "sendMessage", "займет")
+        await self.step("voice_creation", self.callback_update(self.button("vs")), "answerCallbackQuery", "")
+
+    async def calendar(self, n):
+        pack, today = self.harness.pack, datetime.date.today()
+        next_month = (today.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        await self.step("calendar", self.message_update("/tasks"), "sendMessage", "Выберите день")
+        await self.step("calendar", self.callback_update(pack("m", next_month)), "editMessageText", "Выберите день")
+        await self.step("calendar", self.callback_update(pack("d", today)), "editMessageText", "Задачи на")
+
+    async def toggle(self, n):
+        await self.step("toggle", self.callback_update(self.button("t")), "editMessageText", "Задачи на")
+
+    async def time_modification(self, n):
+        await self.step("time_modification", self.callback_update(self.button("e")), "sendMessage", "новое время")
+        await self.step("time_modification", self.message_update(f"{10 + n % 12}:00"), "sendMessage", "Задачи на")
+
+    async def delete(self, n):
+        await self.step("delete", self.callback_update(self.button("x")), "editMessageText", "Задачи на")
+
+    async def run(self, iterations):
+        flows = ([("voice_creation", self.voice_creation)] if self.harness.api.voice else []) + \
+                [(name, getattr(self, name)) for name in FLOWS]
+        for n in range(iterations):
+            for name, flow in flows:
+                started = time.perf_counter()
+                try:
+                    await flow(n)
+                    self.harness.record(name, time.perf_counter() - started)
+                except (asyncio.TimeoutError, LookupError, Rejected) as e:
+                    self.harness.errors[name] = self.harness.errors.get(name, 0) + 1
+                    if isinstance(e, LookupError):
+                        continue
+                    break
+
+
+class Harness:
+    def __init__(self, api, timeout, think=0.0, webhook_url=None):
+        self.api = api
+        self.timeout = timeout
+        self.think = think
+        self.webhook_url = webhook_url
+        self.samples = {}
+        self.errors = {}
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.dp = None
+        self.pack = None
+        self._session = None
+        self._tasks = set()
+
+    async def start(self):
+        from callbacks import pack
+
+        self.pack = pack
+        if self.webhook_url:
+            self._session = ClientSession()
+            return
+        from aiogram import Bot, Dispatcher
+
+        import main
+
+        self.dp = main.dp
+        Bot.set_current(main.bot)
+        Dispatcher.set_current(main.dp)
+        await main.on_startup(main.dp)
+
+    async def deliver(self, update):
+        if self.webhook_url:
+            async with self._session.post(self.webhook_url, json=update) as response:
+                response.raise_for_status()
+            return None
+        from aiogram import types
+
+        task = asyncio.create_task(self.dp.process_update(types.Update(**update)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def record(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    async def stop(self):
+        if self._session is not None:
+            await self._session.close()
+            return
+        import main
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await main.on_shutdown(main.dp)
+        await (await main.bot.get_session()).close()
+
+    def report(self, elapsed):
+        rows = {}
+        for name in sorted(set(self.samples) | set(self.errors)):
+            samples = self.samples.get(name, [])
+            rows[name] = {
+                "count": len(samples),
+                "errors": self.errors.get(name, 0),
+                "throughput": len(samples) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(samples, 0.50) * 1000,
+                "p95_ms": percentile(samples, 0.95) * 1000,
+                "p99_ms": percentile(samples, 0.99) * 1000,
+            }
+        return rows
+
+
+async def run(args):
+    voice = None
+    if args.voice:
+        with open(args.voice, "rb") as f:
+            voice = f.read()
+    api = FakeBotAPI(args.api_latency, voice)
+    llm = FakeYandexGPT(args.llm_latency)
+    runners = []
+    for app, port in ((api.app(), args.api_port), (llm.app(), args.llm_port)):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        runners.append(runner)
+
+    harness = Harness(api, args.timeout, args.think, args.webhook)
+    await harness.start()
+    users = [VirtualUser(harness, 100_000 + i) for i in range(args.users)]
+
+    async def start_user(index, user):
+        await asyncio.sleep(args.ramp * index / max(len(users), 1))
+        await user.run(args.iterations)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(start_user(i, user) for i, user in enumerate(users)))
+    elapsed = time.perf_counter() - started
+    await harness.stop()
+    for runner in runners:
+        await runner.cleanup()
+    return {"users": args.users, "iterations": args.iterations, "elapsed_s": elapsed,
+            "api_calls": api.total_calls, "llm_requests": llm.requests, "flows": harness.report(elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование бота с фейковыми Bot API и YandexGPT")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--ramp", type=float, default=5.0, help="секунд на подключение всех пользователей")
+    parser.add_argument("--timeout", type=float, default=30.0, help="ожидание ответа бота на шаг, секунд")
+    parser.add_argument("--think", type=float, default=0.0, help="пауза пользователя между шагами, секунд; "
+                                                                  "в режиме --webhook нужна, чтобы шаги не обгоняли друг друга")
+    parser.add_argument("--api-latency", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--asr-delay", type=float, default=0.5)
+    parser.add_argument("--voice", help="ogg-файл для сценария голосового ввода")
+    parser.add_argument("--api-port", type=int, default=8781)
+    parser.add_argument("--llm-port", type=int, default=8782)
+    parser.add_argument("--webhook", help="URL запущенного webhook.py вместо бота в этом процессе; запускайте его "
+                                          "с TELEGRAM_API_URL и YANDEX_LLM_URL на фейковые серверы")
+    parser.add_argument("--telegram-limits", action="store_true", help="оставить лимиты отправки Telegram")
+    parser.add_argument("--json", help="сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ["SCHEDULE_DB"] = os.path.join(workdir, "schedule.db")
+    os.environ.setdefault("BOT_TOKEN", BOT_TOKEN)
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{args.api_port}"
+    os.environ["YANDEX_LLM_URL"] = f"http://127.0.0.1:{args.llm_port}"
+    os.environ["ASR_BACKEND"] = "stub"
+    os.environ["ASR_STUB_DELAY"] = str(args.asr_delay)
+    if not args.telegram_limits:
+        os.environ["OUTBOX_GLOBAL_RATE"] = "1000000"
+        os.environ["OUTBOX_CHAT_RATE"] = "1000000"
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.users} пользователей, {report['elapsed_s']:.1f} с, вызовов Bot API: {report['api_calls']}, "
+          f"запросов к LLM: {report['llm_requests']}")
+    print(f"{'сценарий':45s} {'кол-во':>7s} {'ошибки':>7s} {'в сек':>8s} {'p50 мс':>9s} {'p95 мс':>9s} {'p99 мс':>9s}")
+    for name, row in report["flows"].items():
+        print(f"{name:45s} {row['count']:7d} {row['errors']:7d} {row['throughput']:8.1f} "
+              f"{row['p50_ms']:9.1f} {row['p95_ms']:9.1f} {row['p99_ms']:9.1f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,66 +1,78 @@
+import time
+
+STARTED = time.perf_counter()
+
+import calendar
+import functools
+import io
 import logging
 import datetime
 import os
-import sqlite3
-import re
 from pathlib import Path
 
 from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import StatesGroup, State
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 from aiogram.utils import executor
 from dotenv import load_dotenv
-from pydub import AudioSegment
-import speech_recognition as sr
-
-from couples import get_couples
-from speech2text import recognize_voice
-from task import Task
 
+from asr_pool import ASRJobInProgress, ASRPool, ASRQueueFull
+from callbacks import CallbackRouter, pack
+from couples import get_timetable
+from db import Database
+from day_view_cache import DayViewCache
+from estimate_cache import EstimateCache
+from fsm_storage import create_storage
+import metrics
+import migrations
+from outbox import Outbox
+from planner import Occupancy, parse_items, plan
+from reminders import ReminderScheduler, parse_shard
+from slots import DATETIME_FORMAT, day_bitmap, day_bounds, find_slot, format_scheduled_time, from_minutes, to_minutes
+
+metrics.mark_startup("imports", STARTED)
 logging.basicConfig(level=logging.INFO)
 
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
-bot = Bot(token=TOKEN)
-storage = MemoryStorage()
+SLOT_HORIZON_DAYS = int(os.getenv("SLOT_HORIZON_DAYS", "30"))
+DB_PATH = os.getenv("SCHEDULE_DB", "schedule.db")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+bot = Bot(token=TOKEN, server=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION)
+db = Database(DB_PATH)
+storage = create_storage(db)
 dp = Dispatcher(bot, storage=storage)
+router = CallbackRouter()
 
-task = Task()
+task = None
+day_view_cache = DayViewCache()
+asr_pool = ASRPool()
+shard = parse_shard(os.getenv("BOT_WORKER_SHARD"))
+outbox = Outbox(bot, global_rate=float(os.getenv("OUTBOX_GLOBAL_RATE", "30")),
+                chat_rate=float(os.getenv("OUTBOX_CHAT_RATE", "1")), workers=shard[1])
+reminders = ReminderScheduler(db, outbox.send_message, lead=int(os.getenv("REMINDER_LEAD_MINUTES", "15")),
+                              shard=shard)
+metrics_runner = None
 
-conn = sqlite3.connect("schedule.db", check_same_thread=False)
-cursor = conn.cursor()
+dp.middleware.setup(metrics.MetricsMiddleware(started=STARTED))
+metrics.register_stats("asr", asr_pool.stats)
+metrics.register_stats("outbox", outbox.stats)
+metrics.register_stats("day_view_cache", day_view_cache.stats)
+metrics.register_stats("estimate_cache", lambda: task.cache.stats() if task is not None else {})
+metrics.register_stats("db", db.stats)
+metrics.register_stats("reminders", reminders.stats)
+metrics.register_stats("startup", lambda: metrics.startup_phases)
 
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS schedule (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    name TEXT,
-    start_time TEXT,
-    end_time TEXT
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS tasks (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    name TEXT,
-    scheduled_time TEXT
-)
-""")
-conn.commit()
 
+def get_task():
+    global task
+    if task is None:
+        from task import Task
 
-cursor.execute("PRAGMA table_info(tasks)")
-columns = [info[1] for info in cursor.fetchall()]
-if "execution_date" not in columns:
-    cursor.execute("ALTER TABLE tasks ADD COLUMN execution_date TEXT")
-    conn.commit()
-if "completed" not in columns:
-    cursor.execute("ALTER TABLE tasks ADD COLUMN completed INTEGER DEFAULT 0")
-    conn.commit()
+        task = Task(cache=EstimateCache(db))
+    return task
 
 
 main_keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
@@ -71,11 +83,6 @@ main_keyboard.add(
 )
 
 
-def get_russian_weekday(date_obj):
-    days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
-    return days[date_obj.weekday()]
-
-
 class TaskCreation(StatesGroup):
     waiting_for_task_name = State()
     waiting_for_voice = State()
@@ -90,83 +97,114 @@ class TaskTimeModification(StatesGroup):
 
 @dp.message_handler(commands=['start'])
 async def cmd_start(message: types.Message):
-    await message.reply("Привет! Я помогу тебе планировать личное время! Вот, что я могу:\n"
-                        "/addtask - добавить задачу\n"
-                        "/voice_addtask - добавить задачу голосом\n"
-                        "/tasks - посмотреть все задачи", reply_markup=main_keyboard)
+    await outbox.reply(message, "Привет! Я помогу тебе планировать личное время! Вот, что я могу:\n"
+                                "/addtask - добавить задачу\n"
+                                "/voice_addtask - добавить задачу голосом\n"
+                                "/plan - распланировать сразу несколько задач\n"
+                                "/tasks - посмотреть все задачи", reply_markup=main_keyboard)
 
 
 @dp.message_handler(commands=['addtask'])
 async def add_task(message: types.Message):
     await TaskCreation.waiting_for_task_name.set()
-    await message.reply("Введите название задачи:")
+    await outbox.reply(message, "Введите название задачи:")
 
 
 @dp.message_handler(commands=['voice_addtask'])
 async def voice_add_task_command(message: types.Message):
     await TaskCreation.waiting_for_voice.set()
-    await message.reply("Отправьте голосовое сообщение с названием задачи в следующем формате:\n\n"
-                        "<b>Поставь задачу 'посмотреть фильм' на 10 февраля</b>", parse_mode="HTML")
+    await outbox.reply(message, "Отправьте голосовое сообщение с названием задачи в следующем формате:\n\n"
+                                "<b>Поставь задачу 'посмотреть фильм' на 10 февраля</b>", parse_mode="HTML")
+
+
+@dp.message_handler(commands=['plan'])
+async def plan_tasks(message: types.Message):
+    today = datetime.date.today()
+    items, errors = parse_items(message.get_args() or "", today)
+    if not items:
+        await outbox.reply(message, "Отправьте задачи по одной на строку в формате:\n\n"
+                                    "<b>/plan\nназвание; ДД.ММ; минуты</b>\n\n"
+                                    "Дата — крайний срок, длительность можно не указывать.", parse_mode="HTML")
+        return
+    unknown = [name for name, duration, _ in items if duration is None]
+    if unknown:
+        estimates = dict(zip(unknown, await get_task().estimate_many(unknown)))
+        items = [(name, duration or estimates[name], deadline) for name, duration, deadline in items]
+    user_id = message.from_user.id
+    busy_by_day = await load_busy_intervals(user_id, today, max(deadline for _, _, deadline in items))
+    occupancy = Occupancy(busy_by_day, make_couples_lookup(), now=to_minutes(datetime.datetime.now()) + 1)
+    placed, unplaced = plan(items, occupancy, today)
+    if placed:
+        await insert_tasks(user_id, placed)
+    lines = [f"{name}: {format_scheduled_time(start_at, end_at)}" for name, _, start_at, end_at in placed]
+    if unplaced:
+        lines.append("\nНе хватило времени до крайнего срока:")
+        lines += [f"{name} ({duration} мин., до {deadline.strftime('%d.%m')})" for name, duration, deadline in unplaced]
+    if errors:
+        lines.append("\nНе удалось разобрать строки:")
+        lines += errors
+    await outbox.reply(message, f"Запланировано задач: {len(placed)} из {len(items)}.\n" + "\n".join(lines))
 
 
 @dp.message_handler(lambda message: message.text == "➕ Голосовой ввод")
 async def voice_add_task_command(message: types.Message):
     await TaskCreation.waiting_for_voice.set()
-    await message.reply("Отправьте голосовое сообщение с названием задачи в следующем формате:\n\n"
-                        "<b>Поставь задачу 'посмотреть фильм' на 10 февраля</b>", parse_mode="HTML")
+    await outbox.reply(message, "Отправьте голосовое сообщение с названием задачи в следующем формате:\n\n"
+                                "<b>Поставь задачу 'посмотреть фильм' на 10 февраля</b>", parse_mode="HTML")
 
 
 @dp.message_handler(content_types=types.ContentType.VOICE, state=TaskCreation.waiting_for_voice)
 async def process_voice_message(message: types.Message, state: FSMContext):
-    file_id = message.voice.file_id
-    local_filename = f"voice_{message.from_user.id}.ogg"
-    await message.voice.download(destination=local_filename)
-    logging.info(f"Файл сохранен как {local_filename}")
-    mess = await message.answer("Файл получен. Начинаем обработку. Подождите пару секунд...")
+    voice_data = io.BytesIO()
+    await message.voice.download(destination_file=voice_data)
+    logging.info(f"Голосовое сообщение получено: {voice_data.getbuffer().nbytes} байт")
+    progress = {"message": None, "shown_at": 0.0}
+
+    async def show_partial(text):
+        now = time.monotonic()
+        if progress["message"] is None or now - progress["shown_at"] < 1.5:
+            return
+        progress["shown_at"] = now
+        mess = progress["message"]
+        outbox.edit_text(mess.chat.id, mess.message_id, f"Распознаём: {text}...")
+
+    try:
+        job, position = asr_pool.submit(message.from_user.id, voice_data.getvalue(), on_partial=show_partial)
+    except ASRJobInProgress:
+        await outbox.reply(message, "Предыдущее голосовое сообщение ещё обрабатывается, подождите немного.")
+        return
+    except ASRQueueFull:
+        await outbox.reply(message, "Сейчас слишком много голосовых сообщений. Попробуйте через минуту.")
+        return
+    if position > 0:
+        mess = await outbox.answer(message, f"Файл получен. Вы {position}-й в очереди на распознавание, подождите...")
+    else:
+        mess = await outbox.answer(message, "Файл получен. Начинаем обработку. Подождите пару секунд...")
+    progress["message"] = mess
 
     try:
-        recognized_text = recognize_voice(local_filename)
+        recognized_text = await job
     except Exception as e:
         logging.error(f"Ошибка при распознавании голоса: {e}")
-        await message.reply("Ошибка при обработке голосового сообщения.")
-        await mess.delete()
-        try:
-            os.remove(local_filename)
-            os.remove(local_filename.replace(".ogg", ".wav"))
-        except:
-            pass
+        await outbox.reply(message, "Ошибка при обработке голосового сообщения.")
+        outbox.delete_message(mess.chat.id, mess.message_id)
         return
 
     if not recognized_text:
-        await message.reply("Не удалось распознать голосовое сообщение.")
-        await mess.delete()
-        try:
-            os.remove(local_filename)
-            os.remove(local_filename.replace(".ogg", ".wav"))
-        except:
-            pass
+        await outbox.reply(message, "Не удалось распознать голосовое сообщение.")
+        outbox.delete_message(mess.chat.id, mess.message_id)
         return
 
     try:
-        answer = task.get_answer(recognized_text, system_prompt="Предоставь ответ в следующем формате:\nЗадача: текст задачи\nДата: 02-10")
+        answer = await get_task().get_answer_async(recognized_text, system_prompt="Предоставь ответ в следующем формате:\nЗадача: текст задачи\nДата: 02-10")
     except Exception as e:
-        await mess.delete()
-        try:
-            os.remove(local_filename)
-            os.remove(local_filename.replace(".ogg", ".wav"))
-        except:
-            pass
+        outbox.delete_message(mess.chat.id, mess.message_id)
         logging.error(f"Ошибка при обработке распознанного текста: {e}")
-        await message.reply("Ошибка при обработке распознанного текста.")
+        await outbox.reply(message, "Ошибка при обработке распознанного текста.")
         return
 
-    await mess.delete()
-    try:
-        os.remove(local_filename)
-        os.remove(local_filename.replace(".ogg", ".wav"))
-    except:
-        pass
-    await message.reply(f"Распознанный текст:\n{answer}")
+    outbox.delete_message(mess.chat.id, mess.message_id)
+    await outbox.reply(message, f"Распознанный текст:\n{answer}")
 
     task_name = None
     date_text = None
@@ -177,11 +215,10 @@ async def process_voice_message(message: types.Message, state: FSMContext):
         elif "дата" in line.lower():
             date_text = answer.split(":")[i+1].strip().replace(".", "-")[:5]
     if not task_name or not date_text:
-        await message.reply("Не удалось извлечь название задачи или дату из распознанного текста.")
+        await outbox.reply(message, "Не удалось извлечь название задачи или дату из распознанного текста.")
         return
 
     try:
-        print(date_text)
         day, month = map(int, date_text.split("-"))
         current_year = datetime.date.today().year
         execution_date = datetime.date(current_year, month, day)
@@ -191,15 +228,13 @@ async def process_voice_message(message: types.Message, state: FSMContext):
         execution_date_str = execution_date.strftime("%Y-%m-%d")
     except Exception as e:
         logging.error(f"Ошибка парсинга даты: {e}")
-        await message.reply("Неверный формат даты в распознанном тексте.")
+        await outbox.reply(message, "Неверный формат даты в распознанном тексте.")
         return
 
     try:
-        mess = await message.reply("Обработка задачи, подождите пару секунд...")
-        answer = task.get_answer(task_name)
-        print(answer)
-        predicted_duration = int(re.findall(r'\d+', task.get_answer(answer))[0])
-        await mess.delete()
+        mess = await outbox.reply(message, "Обработка задачи, подождите пару секунд...")
+        predicted_duration = await get_task().estimate_duration_async(task_name)
+        outbox.delete_message(mess.chat.id, mess.message_id)
     except Exception as e:
         predicted_duration = 60
         logging.error(f"Ошибка получения времени выполнения: {e}")
@@ -208,34 +243,35 @@ async def process_voice_message(message: types.Message, state: FSMContext):
                             execution_date=execution_date_str, from_voice=True)
 
     user_id = message.from_user.id
-    start_end = find_available_time(user_id, execution_date, predicted_duration)
+    start_end = await find_available_time(user_id, execution_date, predicted_duration)
     if start_end[0] and start_end[1]:
         scheduled_time_str = f"{start_end[0]} - {start_end[1]}"
         keyboard = InlineKeyboardMarkup()
         keyboard.add(
-            InlineKeyboardButton("Назначить", callback_data="voice_set"),
-            InlineKeyboardButton("Отмена", callback_data="voice_cancel")
+            InlineKeyboardButton("Назначить", callback_data=pack("vs")),
+            InlineKeyboardButton("Отмена", callback_data=pack("vc"))
         )
-        await message.reply(
+        await outbox.reply(
+            message,
             f"Задача '{task_name}' займет {predicted_duration} минут с {start_end[0]} до {start_end[1]}.\n",
             reply_markup=keyboard
         )
     else:
-        await message.reply("Нет свободного времени для выполнения этой задачи в выбранный день.")
+        await outbox.reply(message, "Нет свободного времени для выполнения этой задачи в ближайшие дни.")
         await state.finish()
 
 
 @dp.message_handler(lambda message: message.text == "➕ Добавить задачу")
 async def add_task_text(message: types.Message):
     await TaskCreation.waiting_for_task_name.set()
-    await message.reply("Введите название задачи:")
+    await outbox.reply(message, "Введите название задачи:")
 
 
 @dp.message_handler(state=TaskCreation.waiting_for_task_name)
 async def process_task_name(message: types.Message, state: FSMContext):
     task_name = message.text.strip()
     if not task_name:
-        await message.reply("Название не может быть пустым. Введите название задачи:")
+        await outbox.reply(message, "Название не может быть пустым. Введите название задачи:")
         return
     if "/tasks" in task_name or "📋 Список задач" in task_name or "/addtask" in task_name or "➕ Добавить задачу:" in task_name or "/voice_addtask" in task_name or "➕ Голосовой ввод" in task_name:
         await state.finish()
@@ -243,10 +279,9 @@ async def process_task_name(message: types.Message, state: FSMContext):
         return
 
     try:
-        mess = await message.reply("Обработка задачи, подождите пару секунд...")
-        answer = task.get_answer(task_name)
-        predicted_duration = int(re.findall(r'\d+', task.get_answer(answer))[0])
-        await mess.delete()
+        mess = await outbox.reply(message, "Обработка задачи, подождите пару секунд...")
+        predicted_duration = await get_task().estimate_duration_async(task_name)
+        outbox.delete_message(mess.chat.id, mess.message_id)
     except Exception as e:
         predicted_duration = 60
         logging.error(f"Ошибка получения времени выполнения: {e}")
@@ -254,52 +289,54 @@ async def process_task_name(message: types.Message, state: FSMContext):
     await state.update_data(task_name=task_name, task_duration=predicted_duration)
     keyboard = InlineKeyboardMarkup()
     keyboard.add(
-        InlineKeyboardButton("Назначить", callback_data="set"),
-        InlineKeyboardButton("Отмена", callback_data="cancel")
+        InlineKeyboardButton("Назначить", callback_data=pack("s")),
+        InlineKeyboardButton("Отмена", callback_data=pack("c"))
     )
     await TaskCreation.waiting_for_duration_confirmation.set()
-    await message.reply(f"Данная задача займет {predicted_duration} минут.", reply_markup=keyboard)
+    await outbox.reply(message, f"Данная задача займет {predicted_duration} минут.", reply_markup=keyboard)
+
+
+@router.route("c", states=[TaskCreation.waiting_for_duration_confirmation])
+async def process_duration_cancel_callback(callback_query: types.CallbackQuery, state: FSMContext):
+    outbox.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
+    await state.finish()
+    await callback_query.answer()
 
 
-@dp.callback_query_handler(lambda c: c.data in ["set", "cancel"],
-                           state=TaskCreation.waiting_for_duration_confirmation)
+@router.route("s", states=[TaskCreation.waiting_for_duration_confirmation])
 async def process_duration_confirmation_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    if callback_query.data == "cancel":
-        await callback_query.message.delete()
-        await state.finish()
-    elif callback_query.data == "set":
-        await TaskCreation.waiting_for_execution_date.set()
-        today = datetime.date.today()
-        await send_calendar(callback_query.message.chat.id, today.year, today.month, for_task_creation=True)
-        await callback_query.message.delete()
+    await TaskCreation.waiting_for_execution_date.set()
+    today = datetime.date.today()
+    await send_calendar(callback_query.message.chat.id, callback_query.from_user.id, today.year, today.month,
+                        for_task_creation=True)
+    outbox.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
     await callback_query.answer()
 
 
-@dp.callback_query_handler(lambda c: c.data in ["voice_set", "voice_cancel"], state=TaskCreation.waiting_for_voice)
+@router.route("vs", states=[TaskCreation.waiting_for_voice])
 async def process_voice_duration_confirmation(callback_query: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    if callback_query.data == "voice_set":
-        task_name = data.get("task_name")
-        task_duration = data.get("task_duration")
-        execution_date_str = data.get("execution_date")
-        execution_date = datetime.datetime.strptime(execution_date_str, "%Y-%m-%d").date()
-        user_id = callback_query.from_user.id
-        start_end = find_available_time(user_id, execution_date, task_duration)
-        if start_end[0] and start_end[1]:
-            scheduled_time_str = f"{start_end[0]} - {start_end[1]}"
-            cursor.execute("INSERT INTO tasks (user_id, name, execution_date, scheduled_time, completed) VALUES (?, ?, ?, ?, ?)",
-                           (user_id, task_name, execution_date_str, scheduled_time_str, 0))
-            conn.commit()
-            await callback_query.answer(f"Задача '{task_name}' добавлена с {start_end[0]} до {start_end[1]}.", show_alert=True)
-            await state.finish()
-        else:
-            await callback_query.answer("Нет свободного времени для выполнения этой задачи в выбранный день.", show_alert=True)
-            await state.finish()
-    elif callback_query.data == "voice_cancel":
-        await TaskCreation.waiting_for_duration_modification.set()
-        await callback_query.message.edit_text("Задача отменена")
-        await callback_query.answer()
+    task_name = data.get("task_name")
+    task_duration = data.get("task_duration")
+    execution_date_str = data.get("execution_date")
+    execution_date = datetime.datetime.strptime(execution_date_str, "%Y-%m-%d").date()
+    user_id = callback_query.from_user.id
+    start_end = await find_available_time(user_id, execution_date, task_duration)
+    if start_end[0] and start_end[1]:
+        await insert_task(user_id, task_name, execution_date_str, start_end)
+        await callback_query.answer(f"Задача '{task_name}' добавлена с {start_end[0]} до {start_end[1]}.", show_alert=True)
         await state.finish()
+    else:
+        await callback_query.answer("Нет свободного времени для выполнения этой задачи в ближайшие дни.", show_alert=True)
+        await state.finish()
+
+
+@router.route("vc", states=[TaskCreation.waiting_for_voice])
+async def process_voice_duration_cancel(callback_query: types.CallbackQuery, state: FSMContext):
+    await TaskCreation.waiting_for_duration_modification.set()
+    outbox.edit_text(callback_query.message.chat.id, callback_query.message.message_id, "Задача отменена")
+    await callback_query.answer()
+    await state.finish()
 
 
 @dp.message_handler(state=TaskCreation.waiting_for_duration_modification)
@@ -309,9 +346,8 @@ async def process_duration_modification(message: types.Message, state: FSMContex
         if new_duration <= 0:
             raise ValueError("Длительность должна быть положительной.")
     except ValueError:
-        await message.reply("Пожалуйста, введите корректное число минут.")
+        await outbox.reply(message, "Пожалуйста, введите корректное число минут.")
         return
-    print(2)
     data = await state.get_data()
     await state.update_data(task_duration=new_duration)
 
@@ -319,98 +355,166 @@ async def process_duration_modification(message: types.Message, state: FSMContex
         execution_date_str = data.get("execution_date")
         execution_date = datetime.datetime.strptime(execution_date_str, "%Y-%m-%d").date()
         user_id = message.from_user.id
-        start_end = find_available_time(user_id, execution_date, new_duration)
+        start_end = await find_available_time(user_id, execution_date, new_duration)
         if start_end[0] and start_end[1]:
             scheduled_time_str = f"{start_end[0]} - {start_end[1]}"
             keyboard = InlineKeyboardMarkup()
             keyboard.add(
-                InlineKeyboardButton("Подходит", callback_data="voice_set"),
-                InlineKeyboardButton("Изменить", callback_data="voice_cancel")
+                InlineKeyboardButton("Подходит", callback_data=pack("vs")),
+                InlineKeyboardButton("Изменить", callback_data=pack("vc"))
             )
-            await message.reply(f"Новая длительность: {new_duration} минут. Время выполнения: {scheduled_time_str}. Устраивает ли вас это время?", reply_markup=keyboard)
+            await outbox.reply(message, f"Новая длительность: {new_duration} минут. Время выполнения: {scheduled_time_str}. Устраивает ли вас это время?", reply_markup=keyboard)
             await state.finish()
         else:
-            await message.reply("Нет свободного времени для выполнения этой задачи в выбранный день.")
+            await outbox.reply(message, "Нет свободного времени для выполнения этой задачи в ближайшие дни.")
             await state.finish()
     else:
         await TaskCreation.waiting_for_execution_date.set()
         today = datetime.date.today()
-        await send_calendar(message.chat.id, today.year, today.month, for_task_creation=True)
+        await send_calendar(message.chat.id, message.from_user.id, today.year, today.month, for_task_creation=True)
 
 
 @dp.message_handler(state=TaskCreation.waiting_for_execution_date)
 async def process_execution_date_text(message: types.Message, state: FSMContext):
     today = datetime.date.today()
-    await send_calendar(message.chat.id, today.year, today.month, for_task_creation=True)
-    await message.reply("Пожалуйста, выберите дату выполнения задачи из календаря.")
-
-
-def find_available_time(user_id, target_date, task_duration):
-    busy_slots = []
-    cursor.execute("SELECT start_time, end_time FROM schedule WHERE user_id = ? ORDER BY start_time", (user_id,))
-    for row in cursor.fetchall():
-        try:
-            s = datetime.datetime.strptime(row[0], "%Y-%m-%d %H:%M")
-            e = datetime.datetime.strptime(row[1], "%Y-%m-%d %H:%M")
-            if s.date() == target_date:
-                busy_slots.append((s, e))
-        except Exception as e:
-            logging.error(f"Ошибка обработки расписания: {row}, {e}")
-    cursor.execute("SELECT scheduled_time FROM tasks WHERE user_id = ?", (user_id,))
-    for row in cursor.fetchall():
-        try:
-            parts = row[0].split(" - ")
-            if len(parts) == 2:
-                s = datetime.datetime.strptime(parts[0], "%Y-%m-%d %H:%M")
-                e = datetime.datetime.strptime(parts[1], "%Y-%m-%d %H:%M")
-                if s.date() == target_date:
-                    busy_slots.append((s, e))
-        except Exception as e:
-            logging.error(f"Ошибка обработки задачи: {row}, {e}")
-    russian_day = get_russian_weekday(datetime.datetime.combine(target_date, datetime.time(0, 0)))
-    couples = get_couples().get(russian_day, [])
-    if couples:
-        for couple in couples:
-            time_range = couple["time"].replace("–", "-")
-            parts = time_range.split("-")
-            if len(parts) == 2:
-                try:
-                    start_str = parts[0].strip()
-                    end_str = parts[1].strip()
-                    s = datetime.datetime.combine(target_date, datetime.datetime.strptime(start_str, "%H:%M").time())
-                    e = datetime.datetime.combine(target_date, datetime.datetime.strptime(end_str, "%H:%M").time())
-                    busy_slots.append((s, e))
-                except Exception as e:
-                    logging.error(f"Ошибка обработки пары: {couple}, {e}")
-    busy_slots.sort(key=lambda x: x[0])
-    work_start = datetime.datetime.combine(target_date, datetime.time(9, 0))
-    work_end = datetime.datetime.combine(target_date, datetime.time(23, 59))
-    current = work_start
-    task_delta = datetime.timedelta(minutes=task_duration)
-    for slot in busy_slots:
-        if current + task_delta <= slot[0]:
-            return (current.strftime("%Y-%m-%d %H:%M"),
-                    (current + task_delta).strftime("%Y-%m-%d %H:%M"))
-        if current < slot[1]:
-            current = slot[1]
-    if current + task_delta <= work_end:
-        return (current.strftime("%Y-%m-%d %H:%M"),
-                (current + task_delta).strftime("%Y-%m-%d %H:%M"))
-    previous_date = target_date - datetime.timedelta(days=1)
-    if previous_date >= datetime.date.today():
-        return find_available_time(user_id, previous_date, task_duration)
+    await send_calendar(message.chat.id, message.from_user.id, today.year, today.month, for_task_creation=True)
+    await outbox.reply(message, "Пожалуйста, выберите дату выполнения задачи из календаря.")
+
+
+async def load_busy_intervals(user_id, first_date, last_date):
+    range_start, _ = day_bounds(first_date)
+    _, range_end = day_bounds(last_date)
+    busy_by_day = {}
+    rows = await db.fetchall("""
+        SELECT CAST(strftime('%s', start_time) AS INTEGER) / 60, CAST(strftime('%s', end_time) AS INTEGER) / 60
+        FROM schedule
+        WHERE user_id = ? AND start_time >= ? AND start_time < ?
+        UNION ALL
+        SELECT start_at, end_at FROM tasks
+        WHERE user_id = ? AND start_at >= ? AND start_at < ?
+    """, (user_id, first_date.strftime("%Y-%m-%d"), (last_date + datetime.timedelta(days=1)).strftime("%Y-%m-%d"),
+          user_id, range_start, range_end))
+    for start_at, end_at in rows:
+        if start_at is None or end_at is None:
+            logging.error(f"Ошибка обработки расписания пользователя {user_id}: {start_at}, {end_at}")
+            continue
+        busy_by_day.setdefault(from_minutes(start_at).date(), []).append((start_at, end_at))
+    return busy_by_day
+
+
+def make_couples_lookup():
+    timetable = get_timetable()
+    masks = [day_bitmap(timetable.busy[weekday]) for weekday in range(7)]
+
+    def couples_for_day(day):
+        return masks[day.weekday()]
+
+    return couples_for_day
+
+
+async def insert_task(user_id, task_name, execution_date_str, start_end):
+    start = datetime.datetime.strptime(start_end[0], DATETIME_FORMAT)
+    end = datetime.datetime.strptime(start_end[1], DATETIME_FORMAT)
+    rows = await db.execute("""
+        INSERT INTO tasks (user_id, name, execution_date, scheduled_time, start_at, end_at, completed)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        RETURNING id
+    """, (user_id, task_name, execution_date_str, f"{start_end[0]} - {start_end[1]}",
+          to_minutes(start), to_minutes(end), 0))
+    day_view_cache.invalidate(user_id, execution_date_str, start.strftime("%Y-%m-%d"))
+    reminders.schedule(rows[0][0], user_id, to_minutes(start))
+
+
+async def insert_tasks(user_id, placed):
+    rows = [(user_id, name, deadline.strftime("%Y-%m-%d"), format_scheduled_time(start_at, end_at), start_at, end_at, 0)
+            for name, deadline, start_at, end_at in placed]
+    ids = await db.transaction(lambda conn: [conn.execute("""
+        INSERT INTO tasks (user_id, name, execution_date, scheduled_time, start_at, end_at, completed)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        RETURNING id
+    """, row).fetchone()[0] for row in rows], "insert_tasks")
+    day_view_cache.invalidate(user_id, *{row[2] for row in rows}, *{minutes_to_date_str(row[4]) for row in rows})
+    for task_id, row in zip(ids, rows):
+        reminders.schedule(task_id, user_id, row[4])
+
+
+async def fetch_day_tasks(user_id, date_str):
+    day_start, day_end = day_bounds(datetime.datetime.strptime(date_str, "%Y-%m-%d").date())
+    return await db.fetchall("""
+        SELECT * FROM (
+            SELECT id, name, start_at, end_at, completed FROM tasks
+            WHERE user_id = ? AND start_at >= ? AND start_at < ?
+            UNION
+            SELECT id, name, start_at, end_at, completed FROM tasks
+            WHERE user_id = ? AND execution_date = ?
+        )
+        ORDER BY start_at
+    """, (user_id, day_start, day_end, user_id, date_str))
+
+
+def format_time_range(start_at, end_at):
+    if start_at is None or end_at is None:
+        return ""
+    return f"{from_minutes(start_at).strftime('%H:%M')} - {from_minutes(end_at).strftime('%H:%M')}"
+
+
+def minutes_to_date_str(minutes):
+    if minutes is None:
+        return None
+    return from_minutes(minutes).strftime("%Y-%m-%d")
+
+
+async def render_day_view(user_id, selected_date, day_tasks=None):
+    date_str = selected_date.strftime("%Y-%m-%d")
+    timetable = get_timetable()
+    if day_tasks is None:
+        view = day_view_cache.get(user_id, date_str, timetable)
+        if view is not None:
+            return view
+        day_tasks = await fetch_day_tasks(user_id, date_str)
+    markup = InlineKeyboardMarkup()
+    for task_id, task_name, start_at, end_at, completed in day_tasks:
+        time_range_str = format_time_range(start_at, end_at)
+        status_icon = "✅" if completed else "❌"
+        toggle_button_text = f"{status_icon} {task_name}"
+        markup.add(InlineKeyboardButton(toggle_button_text, callback_data=pack("t", task_id, selected_date)))
+        markup.row(
+            InlineKeyboardButton(time_range_str, callback_data=pack("e", task_id, selected_date)),
+            InlineKeyboardButton("🗑️", callback_data=pack("x", task_id, selected_date))
+        )
+    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=pack("m", selected_date.replace(day=1))))
+    couples_texts = timetable.labels[selected_date.weekday()]
+    header_text = f"\U0001F4C5 Задачи на {date_str}:\n(нажмите на первую кнопку для изменения статуса; на время для редактирования времени)"
+    if couples_texts:
+        header_text += "\n\nПары:\n" + "\n".join(couples_texts)
+    view = (header_text, markup)
+    day_view_cache.set(user_id, date_str, timetable, view)
+    return view
+
+
+async def find_available_time(user_id, target_date, task_duration, direction="backward", preferred=None):
+    first_date = min(target_date, datetime.date.today())
+    last_date = target_date
+    if direction != "backward":
+        last_date = target_date + datetime.timedelta(days=SLOT_HORIZON_DAYS)
+    busy_by_day = await load_busy_intervals(user_id, first_date, last_date)
+    start_end = find_slot(busy_by_day, make_couples_lookup(), target_date, first_date, task_duration, last_date,
+                          direction, preferred, now=to_minutes(datetime.datetime.now()) + 1)
+    if start_end[0] is None and direction == "backward":
+        start_end = await find_available_time(user_id, target_date + datetime.timedelta(days=1), task_duration,
+                                              "forward", preferred)
+    return start_end
+
+
+@router.route("d", datetime.date, states=[TaskCreation.waiting_for_execution_date, None])
+async def process_day_callback(callback_query: types.CallbackQuery, state: FSMContext, selected_date):
+    if await state.get_state() is None:
+        await show_tasks_for_day(callback_query, selected_date)
     else:
-        return (None, None)
+        await process_execution_date_callback(callback_query, state, selected_date)
 
 
-@dp.callback_query_handler(lambda c: c.data.startswith("day_"), state=TaskCreation.waiting_for_execution_date)
-async def process_execution_date_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    try:
-        _, year, month, day = callback_query.data.split("_")
-        selected_date = datetime.date(int(year), int(month), int(day))
-    except Exception as e:
-        await callback_query.answer("Неверный формат даты.", show_alert=True)
-        return
+async def process_execution_date_callback(callback_query: types.CallbackQuery, state: FSMContext, selected_date):
     today = datetime.date.today()
     if selected_date < today:
         await callback_query.answer("Нельзя выбрать прошедшую дату.", show_alert=True)
@@ -419,172 +523,128 @@ async def process_execution_date_callback(callback_query: types.CallbackQuery, s
     data = await state.get_data()
     task_name = data.get("task_name")
     task_duration = data.get("task_duration")
-    start_end = find_available_time(user_id, selected_date, task_duration)
+    start_end = await find_available_time(user_id, selected_date, task_duration)
     if start_end[0] and start_end[1]:
-        scheduled_time_str = f"{start_end[0]} - {start_end[1]}"
-        cursor.execute("INSERT INTO tasks (user_id, name, execution_date, scheduled_time, completed) VALUES (?, ?, ?, ?, ?)",
-                       (user_id, task_name, selected_date, scheduled_time_str, 0))
-        conn.commit()
+        await insert_task(user_id, task_name, selected_date.strftime("%Y-%m-%d"), start_end)
         await callback_query.answer(f"Задача '{task_name}' добавлена в расписание с {start_end[0]} до {start_end[1]}.", show_alert=True)
     else:
-        await callback_query.answer("Нет свободного времени для выполнения этой задачи в выбранный день.", show_alert=True)
+        await callback_query.answer("Нет свободного времени для выполнения этой задачи в ближайшие дни.", show_alert=True)
         return
     await state.finish()
     await callback_query.answer()
 
 
-def send_calendar(chat_id, year, month, for_task_creation=False):
-    markup = generate_calendar_markup(year, month)
+async def send_calendar(chat_id, user_id, year, month, for_task_creation=False):
+    markup = generate_calendar_markup(year, month, await load_month_counts(user_id, year, month))
     if for_task_creation:
         header_text = "Выберите дату выполнения задачи:"
     else:
         header_text = f"\U0001F4C5 {year} - {month:02d}\nВыберите день:"
-    return bot.send_message(chat_id, header_text, reply_markup=markup)
-
-
-def generate_calendar_markup(year, month):
-    markup = InlineKeyboardMarkup(row_width=7)
-    header = f"\U0001F4C6 {datetime.date(year, month, 1).strftime('%B %Y')}"
-    markup.add(InlineKeyboardButton(header, callback_data="ignore"))
-    days_of_week = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-    markup.add(*[InlineKeyboardButton(day, callback_data="ignore") for day in days_of_week])
-    first_day = datetime.date(year, month, 1).weekday()
-    days_in_month = (datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)).day if month < 12 else 31
-    buttons = []
-    for _ in range(first_day):
-        buttons.append(InlineKeyboardButton(" ", callback_data="ignore"))
-    for day in range(1, days_in_month + 1):
-        buttons.append(InlineKeyboardButton(str(day), callback_data=f"day_{year}_{month}_{day}"))
-    markup.add(*buttons)
+    return await outbox.send_message(chat_id, header_text, reply_markup=markup)
+
+
+async def load_month_counts(user_id, year, month):
+    month_start, _ = day_bounds(datetime.date(year, month, 1))
+    _, month_end = day_bounds(datetime.date(year, month, calendar.monthrange(year, month)[1]))
+    rows = await db.fetchall("""
+        SELECT start_at / 1440, COUNT(*), SUM(completed) FROM tasks
+        WHERE user_id = ? AND start_at >= ? AND start_at < ?
+        GROUP BY start_at / 1440
+    """, (user_id, month_start, month_end))
+    return {day - month_start // 1440 + 1: (count, done) for day, count, done in rows}
+
+
+@functools.lru_cache(maxsize=256)
+def calendar_skeleton(year, month):
+    ignore = pack("i")
+    rows = [[(f"\U0001F4C6 {datetime.date(year, month, 1).strftime('%B %Y')}", ignore)],
+            [(day, ignore) for day in ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]]]
+    first_day, days_in_month = calendar.monthrange(year, month)
+    cells = [(" ", ignore, None)] * first_day
+    cells += [(str(day), pack("d", datetime.date(year, month, day)), day) for day in range(1, days_in_month + 1)]
+    grid = [cells[i:i + 7] for i in range(0, len(cells), 7)]
     prev_month = month - 1 if month > 1 else 12
     prev_year = year if month > 1 else year - 1
     next_month = month + 1 if month < 12 else 1
     next_year = year if month < 12 else year + 1
-    markup.row(
-        InlineKeyboardButton("← Назад", callback_data=f"month_{prev_year}_{prev_month}"),
-        InlineKeyboardButton("Вперёд →", callback_data=f"month_{next_year}_{next_month}")
-    )
+    nav = [("← Назад", pack("m", datetime.date(prev_year, prev_month, 1))),
+           ("Вперёд →", pack("m", datetime.date(next_year, next_month, 1)))]
+    return rows, grid, nav
+
+
+def day_label(day, counts):
+    count, done = counts.get(day, (0, 0))
+    if not count:
+        return str(day)
+    if done == count:
+        return f"{day}✓"
+    return f"{day}·{count - done}"
+
+
+def generate_calendar_markup(year, month, counts=None):
+    rows, grid, nav = calendar_skeleton(year, month)
+    counts = counts or {}
+    markup = InlineKeyboardMarkup(row_width=7)
+    for row in rows:
+        markup.row(*[InlineKeyboardButton(text, callback_data=data) for text, data in row])
+    for week in grid:
+        markup.row(*[InlineKeyboardButton(day_label(day, counts) if day else text, callback_data=data)
+                     for text, data, day in week])
+    markup.row(*[InlineKeyboardButton(text, callback_data=data) for text, data in nav])
     return markup
 
 
-@dp.callback_query_handler(lambda c: c.data.startswith("month_"), state="*")
-async def change_month(callback_query: types.CallbackQuery, state: FSMContext):
-    _, year, month = callback_query.data.split("_")
-    year, month = int(year), int(month)
-    markup = generate_calendar_markup(year, month)
+@router.route("m", datetime.date)
+async def change_month(callback_query: types.CallbackQuery, state: FSMContext, first_day):
+    year, month = first_day.year, first_day.month
+    markup = generate_calendar_markup(year, month, await load_month_counts(callback_query.from_user.id, year, month))
     current_state = await state.get_state()
     if current_state == TaskCreation.waiting_for_execution_date.state:
         header_text = "Выберите дату выполнения задачи:"
     else:
         header_text = f"\U0001F4C5 {year} - {month:02d}\nВыберите день:"
-    await callback_query.message.edit_text(header_text, reply_markup=markup)
+    outbox.edit_text(callback_query.message.chat.id, callback_query.message.message_id, header_text,
+                     reply_markup=markup)
     await callback_query.answer()
 
 
 @dp.message_handler(commands=['tasks'], state="*")
 async def show_calendar(message: types.Message, state: FSMContext = None):
     today = datetime.date.today()
-    await send_calendar(message.chat.id, today.year, today.month, for_task_creation=False)
+    await send_calendar(message.chat.id, message.from_user.id, today.year, today.month, for_task_creation=False)
 
 
 @dp.message_handler(lambda message: message.text == "📋 Список задач", state="*")
 async def show_calendar_text(message: types.Message, state: FSMContext = None):
     today = datetime.date.today()
-    await send_calendar(message.chat.id, today.year, today.month, for_task_creation=False)
+    await send_calendar(message.chat.id, message.from_user.id, today.year, today.month, for_task_creation=False)
 
 
-@dp.callback_query_handler(lambda c: c.data.startswith("day_"), state=None)
-async def show_tasks_for_day(callback_query: types.CallbackQuery):
-    try:
-        _, year, month, day = callback_query.data.split("_")
-        year, month, day = int(year), int(month), int(day)
-    except Exception as e:
-        await callback_query.answer("Неверный формат даты.", show_alert=True)
-        return
-    date_str = f"{year:04d}-{month:02d}-{day:02d}"
-    selected_date = datetime.date(year, month, day)
-    user_id = callback_query.from_user.id
-    cursor.execute("""
-        SELECT id, name, scheduled_time, completed FROM tasks 
-        WHERE user_id = ? AND (execution_date = ? OR DATE(scheduled_time) = ?)
-        ORDER BY scheduled_time
-    """, (user_id, date_str, date_str))
-    tasks = cursor.fetchall()
-    markup = InlineKeyboardMarkup()
-    for task in tasks:
-        task_id, task_name, scheduled_time, completed = task
-        try:
-            parts = scheduled_time.split(" - ")
-            if len(parts) == 2:
-                start_time = datetime.datetime.strptime(parts[0], "%Y-%m-%d %H:%M").strftime("%H:%M")
-                end_time = datetime.datetime.strptime(parts[1], "%Y-%m-%d %H:%M").strftime("%H:%M")
-                time_range_str = f"{start_time} - {end_time}"
-            else:
-                time_range_str = ""
-        except Exception as e:
-            time_range_str = ""
-        status_icon = "✅" if completed else "❌"
-        toggle_button_text = f"{status_icon} {task_name}"
-        toggle_callback_data = f"toggle_task_{task_id}_{year}_{month}_{day}"
-        delete_callback_data = f"delete_task_{task_id}_{year}_{month}_{day}"
-        markup.add(InlineKeyboardButton(toggle_button_text, callback_data=toggle_callback_data))
-        markup.row(
-            InlineKeyboardButton(time_range_str, callback_data=f"edit_time_{task_id}_{year}_{month}_{day}"),
-            InlineKeyboardButton("🗑️", callback_data=delete_callback_data)
-        )
-    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=f"month_{year}_{month}"))
-    couples_texts = []
-    russian_day = get_russian_weekday(selected_date)
-    couples = get_couples().get(russian_day, [])
-    for couple in couples:
-        time_range = couple["time"].replace("–", "-")
-        parts = time_range.split("-")
-        if len(parts) == 2:
-            try:
-                start_time_str = parts[0].strip()
-                end_time_str = parts[1].strip()
-                couples_texts.append(f"🔔 {couple['subject']} ({start_time_str} - {end_time_str})")
-            except Exception as e:
-                logging.error(f"Ошибка обработки пары: {couple}, {e}")
-    header_text = f"\U0001F4C5 Задачи на {date_str}:\n(нажмите на первую кнопку для изменения статуса; на время для редактирования времени)"
-    if couples_texts:
-        header_text += "\n\nПары:\n" + "\n".join(couples_texts)
-    await callback_query.message.edit_text(header_text, reply_markup=markup)
+async def show_tasks_for_day(callback_query: types.CallbackQuery, selected_date):
+    header_text, markup = await render_day_view(callback_query.from_user.id, selected_date)
+    outbox.edit_text(callback_query.message.chat.id, callback_query.message.message_id, header_text,
+                     reply_markup=markup)
     await callback_query.answer()
 
 
-@dp.callback_query_handler(lambda c: c.data.startswith("edit_time_"))
-async def edit_task_time(callback_query: types.CallbackQuery, state: FSMContext):
-    try:
-        _, _, task_id, year, month, day = callback_query.data.split("_")
-        task_id = int(task_id)
-        year = int(year)
-        month = int(month)
-        day = int(day)
-    except Exception as e:
-        print(e)
-        await callback_query.answer("Ошибка в данных задачи для редактирования времени", show_alert=True)
-        return
-
+@router.route("e", int, datetime.date, states=[None])
+async def edit_task_time(callback_query: types.CallbackQuery, state: FSMContext, task_id, selected_date):
     user_id = callback_query.from_user.id
-    cursor.execute("SELECT scheduled_time FROM tasks WHERE id = ? AND user_id = ?", (task_id, user_id))
-    result = cursor.fetchone()
+    result = await db.fetchone("SELECT start_at, end_at FROM tasks WHERE id = ? AND user_id = ?", (task_id, user_id))
     if not result:
         await callback_query.answer("Задача не найдена", show_alert=True)
         return
-    scheduled_time = result[0]
-    try:
-        parts = scheduled_time.split(" - ")
-        old_start = datetime.datetime.strptime(parts[0], "%Y-%m-%d %H:%M")
-        old_end = datetime.datetime.strptime(parts[1], "%Y-%m-%d %H:%M")
-    except Exception as e:
+    if result[0] is None or result[1] is None:
         await callback_query.answer("Невозможно обработать время задачи", show_alert=True)
         return
+    old_start = from_minutes(result[0])
+    old_end = from_minutes(result[1])
 
-    await state.update_data(edit_task_id=task_id, edit_year=year, edit_month=month, edit_day=day,
+    await state.update_data(edit_task_id=task_id, edit_year=selected_date.year, edit_month=selected_date.month,
+                            edit_day=selected_date.day,
                             old_start=old_start.strftime("%Y-%m-%d %H:%M"),
                             old_end=old_end.strftime("%Y-%m-%d %H:%M"))
-    await callback_query.message.answer("Введите новое время начала задачи в формате HH:MM (например, 14:00):")
+    await outbox.answer(callback_query.message, "Введите новое время начала задачи в формате HH:MM (например, 14:00):")
     await TaskTimeModification.waiting_for_new_time.set()
     await callback_query.answer()
 
@@ -595,7 +655,7 @@ async def process_new_time(message: types.Message, state: FSMContext):
     try:
         new_time = datetime.datetime.strptime(new_time_str, "%H:%M").time()
     except Exception as e:
-        await message.reply("Неверный формат времени. Введите время в формате HH:MM (например, 14:00).")
+        await outbox.reply(message, "Неверный формат времени. Введите время в формате HH:MM (например, 14:00).")
         return
     data = await state.get_data()
     try:
@@ -608,243 +668,118 @@ async def process_new_time(message: types.Message, state: FSMContext):
         old_start = datetime.datetime.strptime(old_start_str, "%Y-%m-%d %H:%M")
         old_end = datetime.datetime.strptime(old_end_str, "%Y-%m-%d %H:%M")
     except Exception as e:
-        await message.reply("Ошибка обработки данных задачи для редактирования времени.")
+        await outbox.reply(message, "Ошибка обработки данных задачи для редактирования времени.")
         await state.finish()
         return
 
-    duration = old_end - old_start
     new_start = datetime.datetime.combine(old_start.date(), new_time)
-    new_end = new_start + duration
     delta = new_start - old_start
 
     user_id = message.from_user.id
     date_str = new_start.strftime("%Y-%m-%d")
-    new_scheduled_time = f"{new_start.strftime('%Y-%m-%d %H:%M')} - {new_end.strftime('%Y-%m-%d %H:%M')}"
-    cursor.execute("UPDATE tasks SET scheduled_time = ? WHERE id = ? AND user_id = ?",
-                   (new_scheduled_time, task_id, user_id))
-
-    cursor.execute("""
-        SELECT id, scheduled_time FROM tasks 
-        WHERE user_id = ? AND execution_date = ? 
-        ORDER BY scheduled_time
-    """, (user_id, date_str))
-    tasks = cursor.fetchall()
-
-    for t in tasks:
-        tid, sched = t
-        if tid == task_id:
-            continue
-        try:
-            parts = sched.split(" - ")
-            t_start = datetime.datetime.strptime(parts[0], "%Y-%m-%d %H:%M")
-            t_end = datetime.datetime.strptime(parts[1], "%Y-%m-%d %H:%M")
-        except Exception as e:
-            continue
-        if t_start > old_start:
-            new_t_start = t_start + delta
-            new_t_end = t_end + delta
-            new_sched = f"{new_t_start.strftime('%Y-%m-%d %H:%M')} - {new_t_end.strftime('%Y-%m-%d %H:%M')}"
-            cursor.execute("UPDATE tasks SET scheduled_time = ? WHERE id = ? AND user_id = ?",
-                           (new_sched, tid, user_id))
-    conn.commit()
-    await message.reply("Время задачи изменено, остальные задачи сдвинуты.")
+    day_start, day_end = day_bounds(old_start.date())
+    rows = await db.execute("""
+        UPDATE tasks SET
+            start_at = CASE WHEN id = :task_id OR (start_at > :old_start AND start_at < :day_end)
+                       THEN start_at + :delta ELSE start_at END,
+            end_at = CASE WHEN id = :task_id OR (start_at > :old_start AND start_at < :day_end)
+                     THEN end_at + :delta ELSE end_at END,
+            scheduled_time = CASE WHEN id = :task_id OR (start_at > :old_start AND start_at < :day_end)
+                             THEN strftime('%Y-%m-%d %H:%M', (start_at + :delta) * 60, 'unixepoch') || ' - ' ||
+                                  strftime('%Y-%m-%d %H:%M', (end_at + :delta) * 60, 'unixepoch')
+                             ELSE scheduled_time END
+        WHERE id IN (
+            SELECT id FROM tasks WHERE user_id = :user_id AND start_at >= :day_start AND start_at < :day_end
+            UNION
+            SELECT id FROM tasks WHERE user_id = :user_id AND execution_date = :date
+        )
+        RETURNING id, name, start_at, end_at, completed, execution_date
+    """, {"task_id": task_id, "user_id": user_id, "old_start": to_minutes(old_start),
+          "delta": int(delta.total_seconds()) // 60, "day_start": day_start, "day_end": day_end, "date": date_str})
+    day_tasks = sorted((row[:5] for row in rows if row[5] == date_str or day_start <= row[2] < day_end),
+                       key=lambda row: (row[2] is not None, row[2]))
+    day_view_cache.invalidate(user_id, date_str, *(row[5] for row in rows),
+                              *(minutes_to_date_str(row[2]) for row in rows))
+    for row in rows:
+        reminders.schedule(row[0], user_id, row[2], row[4])
+    await outbox.reply(message, "Время задачи изменено, остальные задачи сдвинуты.")
     await state.finish()
-    show_tasks_for_day_callback(message.chat.id, date_str, user_id)
+    await show_tasks_for_day_callback(message.chat.id, date_str, user_id, day_tasks)
 
 
-def show_tasks_for_day_callback(chat_id, date_str, user_id):
+async def show_tasks_for_day_callback(chat_id, date_str, user_id, day_tasks=None):
     try:
         selected_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
     except Exception as e:
         return
-    cursor.execute("""
-        SELECT id, name, scheduled_time, completed FROM tasks 
-        WHERE user_id = ? AND (execution_date = ? OR DATE(scheduled_time) = ?)
-        ORDER BY scheduled_time
-    """, (user_id, date_str, date_str))
-    tasks = cursor.fetchall()
-    markup = InlineKeyboardMarkup()
-    for task in tasks:
-        task_id, task_name, scheduled_time, completed = task
-        try:
-            parts = scheduled_time.split(" - ")
-            if len(parts) == 2:
-                start_time = datetime.datetime.strptime(parts[0], "%Y-%m-%d %H:%M").strftime("%H:%M")
-                end_time = datetime.datetime.strptime(parts[1], "%Y-%m-%d %H:%M").strftime("%H:%M")
-                time_range_str = f"{start_time} - {end_time}"
-            else:
-                time_range_str = ""
-        except Exception as e:
-            time_range_str = ""
-        status_icon = "✅" if completed else "❌"
-        toggle_button_text = f"{status_icon} {task_name}"
-        toggle_callback_data = f"toggle_task_{task_id}_{selected_date.year}_{selected_date.month}_{selected_date.day}"
-        delete_callback_data = f"delete_task_{task_id}_{selected_date.year}_{selected_date.month}_{selected_date.day}"
-        markup.add(InlineKeyboardButton(toggle_button_text, callback_data=toggle_callback_data))
-        markup.row(
-            InlineKeyboardButton(time_range_str, callback_data=f"edit_time_{task_id}_{selected_date.year}_{selected_date.month}_{selected_date.day}"),
-            InlineKeyboardButton("🗑️", callback_data=delete_callback_data)
-        )
-
-    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=f"month_{selected_date.year}_{selected_date.month}"))
-
-    couples_texts = []
-    russian_day = get_russian_weekday(selected_date)
-    couples = get_couples().get(russian_day, [])
-    for couple in couples:
-        time_range = couple["time"].replace("–", "-")
-        parts = time_range.split("-")
-        if len(parts) == 2:
-            try:
-                start_time_str = parts[0].strip()
-                end_time_str = parts[1].strip()
-                couples_texts.append(f"🔔 {couple['subject']} ({start_time_str} - {end_time_str})")
-            except Exception as e:
-                logging.error(f"Ошибка обработки пары: {couple}, {e}")
-    header_text = f"\U0001F4C5 Задачи на {date_str}:\n(нажмите на первую кнопку для изменения статуса; на время для редактирования)"
-    if couples_texts:
-        header_text += "\n\nПары:\n" + "\n".join(couples_texts)
-    bot.send_message(chat_id, header_text, reply_markup=markup)
+    header_text, markup = await render_day_view(user_id, selected_date, day_tasks)
+    await outbox.send_message(chat_id, header_text, reply_markup=markup)
 
 
-@dp.callback_query_handler(lambda c: c.data.startswith("toggle_task_"))
-async def toggle_task_status(callback_query: types.CallbackQuery):
-    try:
-        parts = callback_query.data.split("_")
-        task_id = int(parts[2])
-        year = int(parts[3])
-        month = int(parts[4])
-        day = int(parts[5])
-    except Exception as e:
-        await callback_query.answer("Ошибка в данных задачи", show_alert=True)
-        return
+@router.route("t", int, datetime.date, states=[None])
+async def toggle_task_status(callback_query: types.CallbackQuery, state: FSMContext, task_id, selected_date):
     user_id = callback_query.from_user.id
-    cursor.execute("SELECT completed FROM tasks WHERE id = ? AND user_id = ?", (task_id, user_id))
-    result = cursor.fetchone()
+    result = await db.execute("""
+        UPDATE tasks SET completed = CASE WHEN completed THEN 0 ELSE 1 END WHERE id = ? AND user_id = ?
+        RETURNING execution_date, start_at, completed
+    """, (task_id, user_id))
     if not result:
         await callback_query.answer("Задача не найдена", show_alert=True)
         return
-    current_status = result[0]
-    new_status = 0 if current_status else 1
-    cursor.execute("UPDATE tasks SET completed = ? WHERE id = ? AND user_id = ?", (new_status, task_id, user_id))
-    conn.commit()
-    date_str = f"{year:04d}-{month:02d}-{day:02d}"
-    cursor.execute("""
-        SELECT id, name, scheduled_time, completed FROM tasks 
-        WHERE user_id = ? AND (execution_date = ? OR DATE(scheduled_time) = ?)
-        ORDER BY scheduled_time
-    """, (user_id, date_str, date_str))
-    tasks = cursor.fetchall()
-    markup = InlineKeyboardMarkup()
-    for task in tasks:
-        tid, tname, scheduled_time, completed = task
-        try:
-            parts = scheduled_time.split(" - ")
-            if len(parts) == 2:
-                start_time = datetime.datetime.strptime(parts[0], "%Y-%m-%d %H:%M").strftime("%H:%M")
-                end_time = datetime.datetime.strptime(parts[1], "%Y-%m-%d %H:%M").strftime("%H:%M")
-                time_range_str = f"{start_time} - {end_time}"
-            else:
-                time_range_str = ""
-        except Exception as e:
-            time_range_str = ""
-        status_icon = "✅" if completed else "❌"
-        toggle_button_text = f"{status_icon} {tname}"
-        toggle_callback_data = f"toggle_task_{tid}_{year}_{month}_{day}"
-        delete_callback_data = f"delete_task_{tid}_{year}_{month}_{day}"
-        markup.add(InlineKeyboardButton(toggle_button_text, callback_data=toggle_callback_data))
-        markup.row(
-            InlineKeyboardButton(time_range_str, callback_data=f"edit_time_{tid}_{year}_{month}_{day}"),
-            InlineKeyboardButton("🗑️", callback_data=delete_callback_data)
-        )
-
-    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=f"month_{year}_{month}"))
-
-    selected_date = datetime.date(year, month, day)
-    couples_texts = []
-    russian_day = get_russian_weekday(selected_date)
-    couples = get_couples().get(russian_day, [])
-    for couple in couples:
-        time_range = couple["time"].replace("–", "-")
-        parts = time_range.split("-")
-        if len(parts) == 2:
-            try:
-                start_time_str = parts[0].strip()
-                end_time_str = parts[1].strip()
-                couples_texts.append(f"🔔 {couple['subject']} ({start_time_str} - {end_time_str})")
-            except Exception as e:
-                logging.error(f"Ошибка обработки пары: {couple}, {e}")
-    header_text = f"\U0001F4C5 Задачи на {year:04d}-{month:02d}-{day:02d}:\n(нажмите на первую кнопку для изменения статуса)"
-    if couples_texts:
-        header_text += "\n\nПары:\n" + "\n".join(couples_texts)
-    await callback_query.message.edit_text(header_text, reply_markup=markup)
+    execution_date, start_at, completed = result[0]
+    day_view_cache.invalidate(user_id, execution_date, minutes_to_date_str(start_at))
+    reminders.schedule(task_id, user_id, start_at, completed)
+    header_text, markup = await render_day_view(user_id, selected_date)
+    outbox.edit_text(callback_query.message.chat.id, callback_query.message.message_id, header_text,
+                     reply_markup=markup)
     await callback_query.answer("Статус задачи обновлен")
 
 
-@dp.callback_query_handler(lambda c: c.data.startswith("delete_task_"))
-async def delete_task(callback_query: types.CallbackQuery):
-    try:
-        parts = callback_query.data.split("_")
-        task_id = int(parts[2])
-        year = int(parts[3])
-        month = int(parts[4])
-        day = int(parts[5])
-    except Exception as e:
-        await callback_query.answer("Ошибка в данных задачи", show_alert=True)
-        return
+@router.route("x", int, datetime.date, states=[None])
+async def delete_task(callback_query: types.CallbackQuery, state: FSMContext, task_id, selected_date):
     user_id = callback_query.from_user.id
-    cursor.execute("DELETE FROM tasks WHERE id = ? AND user_id = ?", (task_id, user_id))
-    conn.commit()
+    deleted = await db.execute("DELETE FROM tasks WHERE id = ? AND user_id = ? RETURNING execution_date, start_at",
+                               (task_id, user_id))
+    for execution_date, start_at in deleted:
+        day_view_cache.invalidate(user_id, execution_date, minutes_to_date_str(start_at))
+        reminders.cancel(task_id)
     await callback_query.answer("Задача удалена")
-    date_str = f"{year:04d}-{month:02d}-{day:02d}"
-    cursor.execute("""
-        SELECT id, name, scheduled_time, completed FROM tasks 
-        WHERE user_id = ? AND (execution_date = ? OR DATE(scheduled_time) = ?)
-        ORDER BY scheduled_time
-    """, (user_id, date_str, date_str))
-    tasks = cursor.fetchall()
-    markup = InlineKeyboardMarkup()
-    for task in tasks:
-        tid, tname, scheduled_time, completed = task
-        try:
-            parts = scheduled_time.split(" - ")
-            if len(parts) == 2:
-                start_time = datetime.datetime.strptime(parts[0], "%Y-%m-%d %H:%M").strftime("%H:%M")
-                end_time = datetime.datetime.strptime(parts[1], "%Y-%m-%d %H:%M").strftime("%H:%M")
-                time_range_str = f"{start_time} - {end_time}"
-            else:
-                time_range_str = ""
-        except Exception as e:
-            time_range_str = ""
-        status_icon = "✅" if completed else "❌"
-        toggle_button_text = f"{status_icon} {tname}"
-        toggle_callback_data = f"toggle_task_{tid}_{year}_{month}_{day}"
-        delete_callback_data = f"delete_task_{tid}_{year}_{month}_{day}"
-        markup.add(InlineKeyboardButton(toggle_button_text, callback_data=toggle_callback_data))
-        markup.row(
-            InlineKeyboardButton(time_range_str, callback_data=f"edit_time_{tid}_{year}_{month}_{day}"),
-            InlineKeyboardButton("🗑️", callback_data=delete_callback_data)
-        )
-    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=f"month_{year}_{month}"))
-    selected_date = datetime.date(year, month, day)
-    couples_texts = []
-    russian_day = get_russian_weekday(selected_date)
-    couples = get_couples().get(russian_day, [])
-    for couple in couples:
-        time_range = couple["time"].replace("–", "-")
-        parts = time_range.split("-")
-        if len(parts) == 2:
-            try:
-                start_time_str = parts[0].strip()
-                end_time_str = parts[1].strip()
-                couples_texts.append(f"🔔 {couple['subject']} ({start_time_str} - {end_time_str})")
-            except Exception as e:
-                logging.error(f"Ошибка об2работки пары: {couple}, {e}")
-    header_text = f"\U0001F4C5 Задачи на {date_str}:\n(нажмите на первую кнопку для изменения статуса)"
-    if couples_texts:
-        header_text += "\n\nПары:\n" + "\n".join(couples_texts)
-    await callback_query.message.edit_text(header_text, reply_markup=markup)
+    header_text, markup = await render_day_view(user_id, selected_date)
+    outbox.edit_text(callback_query.message.chat.id, callback_query.message.message_id, header_text,
+                     reply_markup=markup)
+
+
+dp.register_callback_query_handler(router.dispatch, state="*")
+
+
+@dp.errors_handler()
+async def count_errors(update: types.Update, exception: Exception):
+    metrics.handler_errors.inc(error=type(exception).__name__)
+
+
+async def on_startup(dispatcher: Dispatcher):
+    global metrics_runner
+    migrations.migrate(db)
+    metrics.mark_startup("migrations", STARTED)
+    reminders.start()
+    metrics.start_profiler()
+    metrics_runner = await metrics.start_server()
+
+
+async def on_shutdown(dispatcher: Dispatcher):
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await reminders.close()
+    await outbox.close()
+    if task is not None:
+        await task.close()
+    await asr_pool.close()
+    await dp.storage.close()
+    await dp.storage.wait_closed()
+    db.close()
+
 
+metrics.mark_startup("setup", STARTED)
 
 if __name__ == '__main__':
-    executor.start_polling(dp, skip_updates=True)
+    executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,248 @@
+import bisect
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+(\w+)", re.IGNORECASE)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+handler_seconds = Histogram("bot_handler_seconds", "Время обработки апдейта по обработчикам")
+handler_errors = Counter("bot_handler_errors_total", "Исключения в обработчиках")
+llm_seconds = Histogram("bot_llm_seconds", "Запросы к YandexGPT по этапам")
+asr_seconds = Histogram("bot_asr_seconds", "Распознавание голоса по этапам")
+db_seconds = Histogram("bot_db_seconds", "Запросы к SQLite")
+db_batch_size = Histogram("bot_db_commit_batch_size", "Число записей в одном групповом коммите",
+                          buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+METRICS = [handler_seconds, handler_errors, llm_seconds, asr_seconds, db_seconds, db_batch_size]
+
+startup_phases = {}
+_stats_sources = {}
+_query_labels = {}
+
+
+def mark_startup(phase, started):
+    startup_phases[phase] = time.perf_counter() - started
+
+
+def query_label(sql):
+    label = _query_labels.get(sql)
+    if label is None:
+        match = QUERY_TABLE.search(sql)
+        label = f"{sql.split(None, 1)[0].lower()}_{match.group(1).lower() if match else 'unknown'}"
+        _query_labels[sql] = label
+    return label
+
+
+def register_stats(prefix, source):
+    _stats_sources[prefix] = source
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for prefix, source in _stats_sources.items():
+        try:
+            stats = source()
+        except Exception as e:
+            logging.error(f"Ошибка сбора статистики {prefix}: {e}")
+            continue
+        for name, value in stats.items():
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE bot_{prefix}_{name} gauge")
+                lines.append(f"bot_{prefix}_{name} {float(value)}")
+    if profiler is not None:
+        lines.extend(["# TYPE bot_profiler_samples_total counter", f"bot_profiler_samples_total {profiler.samples}"])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware(BaseMiddleware):
+    def __init__(self, started=None):
+        super().__init__()
+        self.started = started
+
+    async def on_process_message(self, message, data):
+        self._start(getattr(current_handler.get(None), "__name__", "unknown"), data)
+
+    async def on_process_callback_query(self, callback_query, data):
+        self._start(f"callback:{(callback_query.data or '').partition(':')[0]}", data)
+
+    async def on_post_process_message(self, message, results, data):
+        self._observe("message", data)
+        self._first_update()
+
+    async def on_post_process_callback_query(self, callback_query, results, data):
+        self._observe("callback_query", data)
+        self._first_update()
+
+    def _first_update(self):
+        if self.started is None or "first_update" in startup_phases:
+            return
+        mark_startup("first_update", self.started)
+        logging.info("Время запуска: " + ", ".join(f"{phase} {seconds:.3f} с" for phase, seconds in startup_phases.items()))
+
+    @staticmethod
+    def _start(handler, data):
+        data["_metrics_handler"] = handler
+        data["_metrics_started"] = time.perf_counter()
+
+    @staticmethod
+    def _observe(kind, data):
+        started = data.pop("_metrics_started", None)
+        if started is not None:
+            handler_seconds.observe(time.perf_counter() - started, kind=kind, handler=data.pop("_metrics_handler"))
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.01, thread_id=None, max_depth=40):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.max_depth = max_depth
+        self.samples = 0
+        self.stacks = StackCounter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame, limit=self.max_depth)
+            key = ";".join(f"{os.path.basename(entry.filename)}:{entry.name}" for entry in stack)
+            with self._lock:
+                self.stacks[key] += 1
+                self.samples += 1
+
+    def collapsed(self):
+        with self._lock:
+            stacks = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stop(self):
+        self._stopped.set()
+
+
+profiler = None
+
+
+def start_profiler(interval=None):
+    global profiler
+    interval = interval or float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0") or 0)
+    if interval > 0 and profiler is None:
+        profiler = SamplingProfiler(interval)
+        profiler.start()
+    return profiler
+
+
+async def start_server(host=None, port=None):
+    from aiohttp import web
+
+    port = port or int(os.getenv("METRICS_PORT", "0") or 0)
+    if not port:
+        return None
+
+    async def metrics_view(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    async def profile_view(request):
+        if profiler is None:
+            return web.Response(status=404, text="Профилировщик выключен (PROFILE_SAMPLE_INTERVAL)")
+        return web.Response(text=profiler.collapsed(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    app.router.add_get("/profile", profile_view)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host or os.getenv("METRICS_HOST", "127.0.0.1"), port).start()
+    logging.info(f"Метрики доступны на порту {port}")
+    return runner
@@ -0,0 +1,157 @@
+import logging
+import sqlite3
+import time
+
+from slots import parse_scheduled_time
+
+
+def create_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schedule (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            name TEXT,
+            start_time TEXT,
+            end_time TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            name TEXT,
+            scheduled_time TEXT
+        )
+    """)
+
+
+def task_columns(conn):
+    return [info[1] for info in conn.execute("PRAGMA table_info(tasks)").fetchall()]
+
+
+def add_execution_date(conn):
+    columns = task_columns(conn)
+    if "execution_date" not in columns:
+        conn.execute("ALTER TABLE tasks ADD COLUMN execution_date TEXT")
+    if "completed" not in columns:
+        conn.execute("ALTER TABLE tasks ADD COLUMN completed INTEGER DEFAULT 0")
+
+
+def add_task_minutes(conn):
+    if "start_at" not in task_columns(conn):
+        conn.execute("ALTER TABLE tasks ADD COLUMN start_at INTEGER")
+        conn.execute("ALTER TABLE tasks ADD COLUMN end_at INTEGER")
+
+
+def create_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_schedule_user_start ON schedule (user_id, start_time)")
+    conn.execute("DROP INDEX IF EXISTS idx_tasks_user_scheduled")
+    conn.execute("DROP INDEX IF EXISTS idx_tasks_user_start")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_start_completed ON tasks (user_id, start_at, completed)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_execution_date ON tasks (user_id, execution_date)")
+
+
+def backfill_task_times(conn, batch_size=1000):
+    last_id = 0
+    while True:
+        rows = conn.execute("""
+            SELECT id, scheduled_time FROM tasks
+            WHERE id > ? AND start_at IS NULL AND scheduled_time IS NOT NULL
+            ORDER BY id LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        updates = []
+        for task_id, scheduled_time in rows:
+            try:
+                start_at, end_at = parse_scheduled_time(scheduled_time)
+                updates.append((start_at, end_at, task_id))
+            except Exception as e:
+                logging.error(f"Ошибка обработки задачи: {task_id}, {e}")
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("UPDATE tasks SET start_at = ?, end_at = ? WHERE id = ?", updates)
+        conn.execute("COMMIT")
+        last_id = rows[-1][0]
+
+
+def create_reminder_index(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_pending_start ON tasks (start_at, user_id) WHERE completed = 0")
+
+
+def create_fsm_states(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            chat_id INTEGER,
+            user_id INTEGER,
+            state TEXT,
+            data TEXT,
+            updated_at REAL,
+            PRIMARY KEY (chat_id, user_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)")
+
+
+def create_estimate_cache(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS estimate_cache (
+            key TEXT PRIMARY KEY,
+            answer TEXT,
+            created_at REAL,
+            accessed_at REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_estimate_cache_accessed ON estimate_cache (accessed_at)")
+
+
+MIGRATIONS = [
+    (1, create_tables),
+    (2, add_execution_date),
+    (3, add_task_minutes),
+    (4, create_indexes),
+    (5, backfill_task_times),
+    (6, create_reminder_index),
+    (7, create_fsm_states),
+    (8, create_estimate_cache),
+]
+LATEST = MIGRATIONS[-1][0]
+BATCHED = {backfill_task_times}
+
+
+def current_version(conn):
+    try:
+        return conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+
+def migrate(db):
+    started = time.perf_counter()
+    conn = db.connect()
+    conn.isolation_level = None
+    try:
+        if current_version(conn) >= LATEST:
+            return LATEST
+        conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, applied_at REAL)")
+        for number, migration in MIGRATIONS:
+            if migration in BATCHED:
+                if current_version(conn) < number:
+                    migration(conn)
+                    conn.execute("INSERT OR IGNORE INTO schema_version (version, applied_at) VALUES (?, ?)",
+                                 (number, time.time()))
+                    logging.info(f"Применена миграция {number}: {migration.__name__}")
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if current_version(conn) < number:
+                    migration(conn)
+                    conn.execute("INSERT INTO schema_version (version, applied_at) VALUES (?, ?)", (number, time.time()))
+                    logging.info(f"Применена миграция {number}: {migration.__name__}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        logging.info(f"Схема обновлена до версии {LATEST} за {time.perf_counter() - started:.3f} с")
+        return LATEST
+    finally:
+        conn.close()
@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from aiogram.utils.exceptions import (MessageCantBeDeleted, MessageNotModified, MessageToDeleteNotFound,
+                                      MessageToEditNotFound, RetryAfter)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class Outbox:
+    def __init__(self, bot, global_rate=30, chat_rate=1, chat_burst=3, max_pending=10_000, workers=1,
+                 sweep_interval=60):
+        self.bot = bot
+        global_rate /= workers
+        self.global_bucket = TokenBucket(global_rate, max(global_rate, 1))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_pending = max_pending
+        self.sweep_interval = sweep_interval
+        self.sent = 0
+        self.failed = 0
+        self.merged = 0
+        self.dropped = 0
+        self.retried = 0
+        self.queue_delay = deque(maxlen=1000)
+        self._chats = {}
+        self._buckets = {}
+        self._edits = {}
+        self._heap = []
+        self._scheduled = set()
+        self._busy = set()
+        self._pending = 0
+        self._seq = itertools.count()
+        self._swept_at = time.monotonic()
+        self._wakeup = None
+        self._worker = None
+
+    def _start(self):
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    def _schedule(self, chat_id, ready_at):
+        if chat_id in self._scheduled or chat_id in self._busy or not self._chats.get(chat_id):
+            return
+        self._scheduled.add(chat_id)
+        heapq.heappush(self._heap, (ready_at, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    def _enqueue(self, chat_id, op):
+        if self._worker is None:
+            self._start()
+        self._chats.setdefault(chat_id, deque()).append(op)
+        self._pending += 1
+        self._schedule(chat_id, time.monotonic())
+
+    async def send_message(self, chat_id, text, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(chat_id, {"method": "send", "chat_id": chat_id, "text": text, "kwargs": kwargs,
+                                "futures": [future], "queued_at": time.monotonic()})
+        return await future
+
+    async def reply(self, message, text, **kwargs):
+        return await self.send_message(message.chat.id, text, reply_to_message_id=message.message_id, **kwargs)
+
+    async def answer(self, message, text, **kwargs):
+        return await self.send_message(message.chat.id, text, **kwargs)
+
+    def edit_text(self, chat_id, message_id, text, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        op = self._edits.get((chat_id, message_id))
+        if op is not None:
+            op["text"], op["kwargs"] = text, kwargs
+            op["futures"].append(future)
+            self.merged += 1
+            return future
+        if self._pending >= self.max_pending:
+            self.dropped += 1
+            future.set_result(None)
+            return future
+        op = {"method": "edit", "chat_id": chat_id, "message_id": message_id, "text": text, "kwargs": kwargs,
+              "futures": [future], "queued_at": time.monotonic()}
+        self._edits[(chat_id, message_id)] = op
+        self._enqueue(chat_id, op)
+        return future
+
+    def delete_message(self, chat_id, message_id):
+        future = asyncio.get_running_loop().create_future()
+        edit = self._edits.pop((chat_id, message_id), None)
+        if edit is not None:
+            self._chats[chat_id].remove(edit)
+            self._pending -= 1
+            self.merged += 1
+            for edit_future in edit["futures"]:
+                if not edit_future.done():
+                    edit_future.set_result(None)
+        self._enqueue(chat_id, {"method": "delete", "chat_id": chat_id, "message_id": message_id,
+                                "futures": [future], "queued_at": time.monotonic()})
+        return future
+
+    async def _run(self):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            ready_at = self._heap[0][0]
+            now = time.monotonic()
+            if now - self._swept_at >= self.sweep_interval:
+                self._sweep_buckets(now)
+            if ready_at > now:
+                self._wakeup.clear()
+                timer = asyncio.get_running_loop().call_later(ready_at - now, self._wakeup.set)
+                try:
+                    await self._wakeup.wait()
+                finally:
+                    timer.cancel()
+                continue
+            delay = self.global_bucket.delay(now)
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            _, _, chat_id = heapq.heappop(self._heap)
+            self._scheduled.discard(chat_id)
+            bucket = self._buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            delay = bucket.delay(now)
+            if delay:
+                self._schedule(chat_id, now + delay)
+                continue
+            bucket.take()
+            self.global_bucket.take()
+            op = self._chats[chat_id].popleft()
+            self._pending -= 1
+            if op["method"] == "edit":
+                del self._edits[(chat_id, op["message_id"])]
+            self._busy.add(chat_id)
+            asyncio.create_task(self._deliver(op))
+
+    async def _deliver(self, op):
+        chat_id = op["chat_id"]
+        self.queue_delay.append(time.monotonic() - op["queued_at"])
+        ready_at = time.monotonic()
+        result, error = None, None
+        try:
+            if op["method"] == "send":
+                result = await self.bot.send_message(chat_id, op["text"], **op["kwargs"])
+            elif op["method"] == "delete":
+                result = await self.bot.delete_message(chat_id, op["message_id"])
+            else:
+                result = await self.bot.edit_message_text(op["text"], chat_id=chat_id, message_id=op["message_id"],
+                                                          **op["kwargs"])
+            self.sent += 1
+        except RetryAfter as e:
+            self.retried += 1
+            ready_at += e.timeout
+            self._requeue(op)
+            op = None
+        except (MessageNotModified, MessageToEditNotFound, MessageToDeleteNotFound, MessageCantBeDeleted):
+            self.dropped += 1
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Ошибка отправки сообщения в чат {chat_id}: {e}")
+            if op["method"] == "send":
+                error = e
+        finally:
+            self._busy.discard(chat_id)
+            if not self._chats.get(chat_id):
+                self._chats.pop(chat_id, None)
+            self._schedule(chat_id, ready_at)
+        if op is not None:
+            for future in op["futures"]:
+                if not future.done():
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+
+    def _sweep_buckets(self, now):
+        self._swept_at = now
+        for chat_id, bucket in list(self._buckets.items()):
+            if chat_id not in self._chats and chat_id not in self._busy and bucket.full(now):
+                del self._buckets[chat_id]
+
+    def _requeue(self, op):
+        chat_id = op["chat_id"]
+        if op["method"] == "edit":
+            newer = self._edits.get((chat_id, op["message_id"]))
+            if newer is not None:
+                newer["futures"].extend(op["futures"])
+                self.merged += 1
+                return
+            self._edits[(chat_id, op["message_id"])] = op
+        self._chats.setdefault(chat_id, deque()).appendleft(op)
+        self._pending += 1
+
+    def stats(self):
+        return {
+            "pending": self._pending,
+            "chats": len(self._scheduled) + len(self._busy),
+            "buckets": len(self._buckets),
+            "sent": self.sent,
+            "failed": self.failed,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "retried": self.retried,
+            "queue_delay_avg": sum(self.queue_delay) / len(self.queue_delay) if self.queue_delay else 0.0,
+            "queue_delay_max": max(self.queue_delay, default=0.0),
+        }
+
+    async def close(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
@@ -0,0 +1,71 @@
+import datetime
+
+from slots import day_bounds, earliest_start, free_minutes, interval_mask, slot_starts
+
+
+class Occupancy:
+    def __init__(self, busy_by_day, couples_by_day, now=None):
+        self.busy_by_day = busy_by_day
+        self.couples_by_day = couples_by_day
+        self.now = now
+        self._free = {}
+
+    def free(self, day):
+        free = self._free.get(day)
+        if free is None:
+            free = self._free[day] = free_minutes(day, self.busy_by_day.get(day, []), self.couples_by_day(day),
+                                                  self.now)
+        return free
+
+    def reserve(self, day, start, duration):
+        self._free[day] = self.free(day) & ~interval_mask(start, start + duration)
+
+    def place(self, duration, first_date, last_date):
+        day = first_date
+        while day <= last_date:
+            starts = slot_starts(self.free(day), duration)
+            if starts:
+                start = earliest_start(starts)
+                self.reserve(day, start, duration)
+                day_start, _ = day_bounds(day)
+                return day_start + start
+            day += datetime.timedelta(days=1)
+        return None
+
+
+def plan(items, occupancy, first_date):
+    placed, unplaced = [], []
+    for name, duration, deadline in sorted(items, key=lambda item: (item[2], -item[1])):
+        start = occupancy.place(duration, first_date, deadline)
+        if start is None:
+            unplaced.append((name, duration, deadline))
+        else:
+            placed.append((name, deadline, start, start + duration))
+    placed.sort(key=lambda row: row[2])
+    return placed, unplaced
+
+
+def parse_date(text, today):
+    day, month = map(int, text.strip().replace(".", "-").split("-")[:2])
+    date = datetime.date(today.year, month, day)
+    if date < today:
+        date = datetime.date(today.year + 1, month, day)
+    return date
+
+
+def parse_items(text, today):
+    items, errors = [], []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        parts = [part.strip() for part in line.split(";")]
+        try:
+            if len(parts) not in (2, 3) or not parts[0]:
+                raise ValueError(line)
+            duration = int(parts[2]) if len(parts) == 3 else None
+            if duration is not None and duration <= 0:
+                raise ValueError(line)
+            items.append((parts[0], duration, parse_date(parts[1], today)))
+        except ValueError:
+            errors.append(line.strip())
+    return items, errors
@@ -0,0 +1,163 @@
+import asyncio
+import datetime
+import heapq
+import json
+import logging
+
+from slots import EPOCH, from_minutes
+
+
+def now_minutes():
+    return (datetime.datetime.now() - EPOCH).total_seconds() / 60
+
+
+def reminder_text(name, start_at, end_at, now):
+    minutes = round(start_at - now)
+    when = f"Через {minutes} мин. начнётся" if minutes >= 1 else "Сейчас начинается"
+    return (f"⏰ {when} задача «{name}» "
+            f"({from_minutes(start_at).strftime('%H:%M')}–{from_minutes(end_at).strftime('%H:%M')})")
+
+
+def parse_shard(text):
+    index, count = map(int, (text or "0/1").split("/"))
+    return index, count
+
+
+class ReminderScheduler:
+    def __init__(self, db, send, lead=15, window=24 * 60, refill=60, shard=(0, 1), batch_size=500):
+        self.db = db
+        self.send = send
+        self.lead = lead
+        self.window = window
+        self.refill = refill
+        self.shard = shard
+        self.batch_size = batch_size
+        self.loaded_until = None
+        self.loads = 0
+        self.fired = 0
+        self.skipped = 0
+        self.failed = 0
+        self._heap = []
+        self._due = {}
+        self._sending = set()
+        self._wakeup = None
+        self._worker = None
+
+    def start(self):
+        if self._worker is not None:
+            return
+        self.loaded_until = int(now_minutes())
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    def schedule(self, task_id, user_id, start_at, completed=False):
+        if self.loaded_until is None or user_id % self.shard[1] != self.shard[0]:
+            return
+        if completed or start_at is None or start_at >= self.loaded_until or start_at <= now_minutes():
+            self.cancel(task_id)
+            return
+        fire_at = start_at - self.lead
+        if self._due.get(task_id) == fire_at:
+            return
+        self._due[task_id] = fire_at
+        heapq.heappush(self._heap, (fire_at, task_id))
+        if self._heap[0][1] == task_id:
+            self._wakeup.set()
+
+    def cancel(self, task_id):
+        self._due.pop(task_id, None)
+
+    async def _run(self):
+        while True:
+            now = now_minutes()
+            if now + self.window - self.refill >= self.loaded_until:
+                await self._load(self.loaded_until, int(now) + self.window)
+                continue
+            if self._heap and self._heap[0][0] <= now:
+                await self._fire(now)
+                continue
+            wake_at = self.loaded_until - self.window + self.refill
+            if self._heap:
+                wake_at = min(wake_at, self._heap[0][0])
+            self._wakeup.clear()
+            timer = asyncio.get_running_loop().call_later((wake_at - now) * 60, self._wakeup.set)
+            try:
+                await self._wakeup.wait()
+            finally:
+                timer.cancel()
+
+    async def _load(self, first, last):
+        self.loaded_until = last
+        try:
+            rows = await self.db.fetchall("""
+                SELECT id, start_at FROM tasks
+                WHERE start_at >= ? AND start_at < ? AND completed = 0 AND user_id % ? = ?
+            """, (first, last, self.shard[1], self.shard[0]))
+        except Exception as e:
+            logging.error(f"Ошибка загрузки напоминаний: {e}")
+            self.loaded_until = first
+            await asyncio.sleep(5)
+            return
+        now = now_minutes()
+        for task_id, start_at in rows:
+            if task_id not in self._due and start_at - self.lead >= now:
+                self._due[task_id] = start_at - self.lead
+                self._heap.append((start_at - self.lead, task_id))
+        heapq.heapify(self._heap)
+        self.loads += 1
+
+    async def _fire(self, now):
+        due = {}
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            fire_at, task_id = heapq.heappop(self._heap)
+            if self._due.get(task_id) == fire_at:
+                del self._due[task_id]
+                due[task_id] = fire_at + self.lead
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            self._heap = [(fire_at, task_id) for task_id, fire_at in self._due.items()]
+            heapq.heapify(self._heap)
+        if not due:
+            return
+        try:
+            rows = await self.db.fetchall("""
+                SELECT id, user_id, name, start_at, end_at, completed FROM tasks
+                WHERE id IN (SELECT value FROM json_each(?))
+            """, (json.dumps(list(due)),))
+        except Exception as e:
+            self.failed += len(due)
+            logging.error(f"Ошибка проверки напоминаний: {e}")
+            return
+        self.skipped += len(due) - len(rows)
+        for task_id, user_id, name, start_at, end_at, completed in rows:
+            if completed or start_at != due[task_id]:
+                self.skipped += 1
+                continue
+            send = asyncio.create_task(self._send(user_id, reminder_text(name, start_at, end_at, now)))
+            self._sending.add(send)
+            send.add_done_callback(self._sending.discard)
+
+    async def _send(self, user_id, text):
+        try:
+            await self.send(user_id, text)
+            self.fired += 1
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Ошибка отправки напоминания пользователю {user_id}: {e}")
+
+    def stats(self):
+        return {
+            "pending": len(self._due),
+            "heap": len(self._heap),
+            "loads": self.loads,
+            "fired": self.fired,
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            for send in self._sending:
+                send.cancel()
+            await asyncio.gather(self._worker, *self._sending, return_exceptions=True)
+            self._worker = None
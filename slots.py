@@ -0,0 +1,119 @@
+import datetime
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+EPOCH = datetime.datetime(1970, 1, 1)
+WORK_START = datetime.time(9, 0)
+WORK_END = datetime.time(23, 59)
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_minutes(dt):
+    return int((dt - EPOCH).total_seconds()) // 60
+
+
+def from_minutes(minutes):
+    return EPOCH + datetime.timedelta(minutes=minutes)
+
+
+def day_bounds(day):
+    start = to_minutes(datetime.datetime.combine(day, datetime.time(0, 0)))
+    return start, start + MINUTES_PER_DAY
+
+
+def parse_scheduled_time(scheduled_time):
+    parts = scheduled_time.split(" - ")
+    if len(parts) != 2:
+        raise ValueError(f"Неверный формат времени задачи: {scheduled_time}")
+    start = datetime.datetime.strptime(parts[0], DATETIME_FORMAT)
+    end = datetime.datetime.strptime(parts[1], DATETIME_FORMAT)
+    return to_minutes(start), to_minutes(end)
+
+
+def format_scheduled_time(start, end):
+    return f"{from_minutes(start).strftime(DATETIME_FORMAT)} - {from_minutes(end).strftime(DATETIME_FORMAT)}"
+
+
+def interval_mask(start, end):
+    start, end = max(start, 0), min(end, MINUTES_PER_DAY)
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+def day_bitmap(intervals, day_start=0):
+    bitmap = 0
+    for start, end in intervals:
+        bitmap |= interval_mask(start - day_start, end - day_start)
+    return bitmap
+
+
+WORK_MASK = interval_mask(WORK_START.hour * 60 + WORK_START.minute, WORK_END.hour * 60 + WORK_END.minute)
+
+
+def free_minutes(day, busy_intervals, couples_mask, now=None):
+    day_start, _ = day_bounds(day)
+    free = WORK_MASK & ~(day_bitmap(busy_intervals, day_start) | couples_mask)
+    if now is not None:
+        free &= ~interval_mask(0, now - day_start)
+    return free
+
+
+def slot_starts(free, duration):
+    starts, width = free, 1
+    while width < duration and starts:
+        step = min(width, duration - width)
+        starts &= starts >> step
+        width += step
+    return starts
+
+
+def earliest_start(starts):
+    return (starts & -starts).bit_length() - 1
+
+
+def nearest_start(starts, preferred):
+    preferred = min(max(preferred, 0), MINUTES_PER_DAY - 1)
+    after = starts >> preferred
+    before = starts & ((1 << preferred) - 1)
+    best = None
+    if after:
+        best = preferred + earliest_start(after)
+    if before:
+        candidate = before.bit_length() - 1
+        if best is None or preferred - candidate < best - preferred:
+            best = candidate
+    return best
+
+
+def search_order(target_date, first_date, last_date, direction):
+    one_day = datetime.timedelta(days=1)
+    if direction == "backward":
+        day = target_date
+        while day >= first_date:
+            yield day
+            day -= one_day
+    elif direction == "forward":
+        day = target_date
+        while day <= last_date:
+            yield day
+            day += one_day
+    else:
+        if first_date <= target_date <= last_date:
+            yield target_date
+        for offset in range(1, max((target_date - first_date).days, (last_date - target_date).days) + 1):
+            for day in (target_date - offset * one_day, target_date + offset * one_day):
+                if first_date <= day <= last_date:
+                    yield day
+
+
+def find_slot(busy_by_day, couples_by_day, target_date, first_date, task_duration, last_date=None,
+              direction="backward", preferred=None, now=None):
+    for day in search_order(target_date, first_date, last_date or target_date, direction):
+        starts = slot_starts(free_minutes(day, busy_by_day.get(day, []), couples_by_day(day), now), task_duration)
+        if not starts:
+            continue
+        day_start, _ = day_bounds(day)
+        start = day_start + (earliest_start(starts) if preferred is None else nearest_start(starts, preferred))
+        return (from_minutes(start).strftime(DATETIME_FORMAT),
+                from_minutes(start + task_duration).strftime(DATETIME_FORMAT))
+    return (None, None)
@@ -1,11 +1,15 @@
 import logging
 import os
 import subprocess
-import speech_recognition as sr
+import threading
+
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", r"C:\Users\gladk_cegft4n\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg.Essentials_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-7.1-essentials_build\bin\ffmpeg.exe")
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
 
 
 def convert_ogg_to_wav(input_filename: str, output_filename: str):
-    command = [r"C:\Users\gladk_cegft4n\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg.Essentials_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-7.1-essentials_build\bin\ffmpeg.exe", "-y", "-i", input_filename, output_filename]
+    command = [FFMPEG_PATH, "-y", "-i", input_filename, output_filename]
     result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     if result.returncode != 0:
         err = result.stderr.decode()
@@ -14,6 +18,31 @@ def convert_ogg_to_wav(input_filename: str, output_filename: str):
     else:
         logging.info("Конвертация завершена успешно.")
 
+
+def convert_ogg_to_pcm(ogg_data: bytes) -> bytes:
+    command = [FFMPEG_PATH, "-loglevel", "error", "-i", "pipe:0",
+               "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+    result = subprocess.run(command, input=ogg_data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        err = result.stderr.decode()
+        logging.error(f"Ошибка конвертации: {err}")
+        raise Exception("Конвертация файла не удалась")
+    return result.stdout
+
+
+def _recognize_audio(recognizer, audio_data):
+    import speech_recognition as sr
+
+    try:
+        recognized_text = recognizer.recognize_google(audio_data, language="ru-RU")
+        return recognized_text
+    except sr.UnknownValueError:
+        logging.error("Речь не распознана.")
+    except sr.RequestError as e:
+        logging.error(f"Ошибка запроса к сервису распознавания: {e}")
+    return None
+
+
 def recognize_voice(input_filename: str) -> str:
     base, ext = os.path.splitext(input_filename)
     if ext.lower() == ".ogg":
@@ -22,6 +51,8 @@ def recognize_voice(input_filename: str) -> str:
     else:
         wav_filename = input_filename
 
+    import speech_recognition as sr
+
     recognizer = sr.Recognizer()
     try:
         with sr.AudioFile(wav_filename) as source:
@@ -30,11 +61,59 @@ def recognize_voice(input_filename: str) -> str:
         logging.error(f"Ошибка чтения аудиофайла: {e}")
         return None
 
+    return _recognize_audio(recognizer, audio_data)
+
+
+def recognize_pcm(pcm_data: bytes) -> str:
+    if not pcm_data:
+        logging.error("Пустой аудиопоток после конвертации.")
+        return None
+    import speech_recognition as sr
+
+    return _recognize_audio(sr.Recognizer(), sr.AudioData(pcm_data, SAMPLE_RATE, SAMPLE_WIDTH))
+
+
+def recognize_voice_bytes(ogg_data: bytes) -> str:
+    return recognize_pcm(convert_ogg_to_pcm(ogg_data))
+
+
+def stream_ogg_to_pcm(ogg_data: bytes, chunk_size: int = SAMPLE_RATE * SAMPLE_WIDTH // 2):
+    command = [FFMPEG_PATH, "-loglevel", "error", "-i", "pipe:0",
+               "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def feed():
+        try:
+            process.stdin.write(ogg_data)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
     try:
-        recognized_text = recognizer.recognize_google(audio_data, language="ru-RU")
-        return recognized_text
-    except sr.UnknownValueError:
-        logging.error("Речь не распознана.")
-    except sr.RequestError as e:
-        logging.error(f"Ошибка запроса к сервису распознавания: {e}")
-    return None
\ No newline at end of file
+        while True:
+            chunk = process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        process.stdout.close()
+        writer.join()
+        err = process.stderr.read().decode()
+        process.stderr.close()
+        if process.wait() != 0:
+            logging.error(f"Ошибка конвертации: {err}")
+            raise Exception("Конвертация файла не удалась")
+
+
+def recognize_stream(ogg_data: bytes, backend, on_partial=None) -> str:
+    stream = backend.open_stream()
+    partial = ""
+    for chunk in stream_ogg_to_pcm(ogg_data):
+        text = stream.accept(chunk)
+        if on_partial is not None and text and text != partial:
+            partial = text
+            on_partial(text)
+    return stream.finish()
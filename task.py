@@ -1,48 +1,253 @@
+import asyncio
+import json
+import logging
 import os
+import re
 import time
 
-import requests
+import aiohttp
 from dotenv import load_dotenv
 
+from metrics import llm_seconds
+
+DEFAULT_SYSTEM_PROMPT = """Представь, что ты профессионал по планированию времени. Твоя задача - это отвечать сколько времени уйдет на задачу по ее названию. В твоем ответе количество минут должно быть целым ровным числом, без никаких промежутков.Твой ответ должен быть в следующем формате: Данная задача займет какое-то количество минут. Хотите изменить?"""
+
+BATCH_SYSTEM_PROMPT = """Представь, что ты профессионал по планированию времени. Тебе дан пронумерованный список задач. Для каждой задачи определи, сколько минут уйдет на ее выполнение. Количество минут должно быть целым ровным числом, без никаких промежутков. Ответь строго по одной строке на задачу в формате: номер. количество минут. Например:
+1. 30
+2. 90"""
+
+
+def parse_minutes(text):
+    return int(re.findall(r'\d+', text)[0])
+
+
+def duration_produced(text):
+    return re.search(r'\d+\D', text) is not None
+
+
+def parse_batch_minutes(text, count):
+    result = {}
+    for number, minutes in re.findall(r'^\s*(\d+)[.)]\s*\D*?(\d+)', text, flags=re.MULTILINE):
+        index = int(number) - 1
+        if 0 <= index < count and int(minutes) > 0:
+            result[index] = int(minutes)
+    return result
+
+
 class Task:
-    def __init__(self):
+    def __init__(self, cache=None):
         load_dotenv()
         self.folder_id = os.getenv("YANDEX_FOLDER_ID")
         self.api_key = os.getenv("YANDEX_API_KEY")
+        self.api_url = os.getenv("YANDEX_LLM_URL", "https://llm.api.cloud.yandex.net")
         self.gpt_model = 'yandexgpt-32k'
-        self.system_prompt = """Представь, что ты профессионал по планированию времени. Твоя задача - это отвечать сколько времени уйдет на задачу по ее названию. В твоем ответе количество минут должно быть целым ровным числом, без никаких промежутков.Твой ответ должен быть в следующем формате: Данная задача займет какое-то количество минут. Хотите изменить?"""
+        self.system_prompt = DEFAULT_SYSTEM_PROMPT
+        self.request_timeout = 10
+        self.answer_timeout = 60
+        self.poll_interval = 0.2
+        self.max_poll_interval = 2
+        self.batch_size = 10
+        self.completion_mode = os.getenv("YANDEX_COMPLETION_MODE", "stream")
+        self.sync_prompt_limit = 4000
+        self.max_concurrency = 5
+        self.cache = cache
+        self._session = None
 
-    def get_answer(self, user_prompt, system_prompt="""Представь, что ты профессионал по планированию времени. Твоя задача - это отвечать сколько времени уйдет на задачу по ее названию. В твоем ответе количество минут должно быть целым ровным числом, без никаких промежутков.Твой ответ должен быть в следующем формате: Данная задача займет какое-то количество минут. Хотите изменить?"""):
+    def _build_body(self, user_prompt, system_prompt, stream=False):
         self.system_prompt = system_prompt
-        body = {
+        return {
             'modelUri': f'gpt://{self.folder_id}/{self.gpt_model}',
-            'completionOptions': {'stream': False, 'temperature': 0.3, 'maxTokens': 2000},
+            'completionOptions': {'stream': stream, 'temperature': 0.3, 'maxTokens': 2000},
             'messages': [
                 {'role': 'system', 'text': self.system_prompt},
                 {'role': 'user', 'text': user_prompt},
             ],
         }
-        url = 'https://llm.api.cloud.yandex.net/foundationModels/v1/completionAsync'
-        headers = {
+
+    def _headers(self):
+        return {
             'Content-Type': 'application/json',
             'Authorization': f'Api-Key {self.api_key}'
         }
 
-        response = requests.post(url, headers=headers, json=body)
+    @staticmethod
+    def _extract_text(data):
+        return data['response']['alternatives'][0]['message']['text']
+
+    def get_answer(self, user_prompt, system_prompt=DEFAULT_SYSTEM_PROMPT):
+        import requests
+
+        body = self._build_body(user_prompt, system_prompt)
+        url = f'{self.api_url}/foundationModels/v1/completionAsync'
+
+        response = requests.post(url, headers=self._headers(), json=body, timeout=self.request_timeout)
         operation_id = response.json().get('id')
 
-        url = f"https://llm.api.cloud.yandex.net:443/operations/{operation_id}"
-        headers = {"Authorization": f"Api-Key {self.api_key}"}
+        url = f"{self.api_url}/operations/{operation_id}"
 
         while True:
-            response = requests.get(url, headers=headers)
+            response = requests.get(url, headers=self._headers(), timeout=self.request_timeout)
             done = response.json()["done"]
             if done:
                 break
             time.sleep(2)
 
-        data = response.json()
-        answer = data['response']['alternatives'][0]['message']['text']
+        return self._extract_text(response.json())
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self._headers(),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=60),
+            )
+        return self._session
+
+    @staticmethod
+    def _partial_prompt(system_prompt, stop_when):
+        return f"{system_prompt}\0stop:{stop_when.__name__}"
+
+    async def _cached(self, user_prompt, system_prompt, stop_when=None):
+        if self.cache is None:
+            return None
+        cached = await self.cache.get(user_prompt, system_prompt)
+        if cached is None and stop_when is not None:
+            cached = await self.cache.get(user_prompt, self._partial_prompt(system_prompt, stop_when))
+        return cached
+
+    async def get_answer_async(self, user_prompt, system_prompt=DEFAULT_SYSTEM_PROMPT, stop_when=None):
+        cached = await self._cached(user_prompt, system_prompt, stop_when)
+        if cached is not None:
+            return cached
+        answer, stopped = await asyncio.wait_for(self._complete_async(user_prompt, system_prompt, stop_when),
+                                                 self.answer_timeout)
+        if self.cache is not None:
+            prompt = self._partial_prompt(system_prompt, stop_when) if stopped else system_prompt
+            await self.cache.set(user_prompt, prompt, answer)
         return answer
 
+    async def estimate_duration_async(self, task_name):
+        answer = await self.get_answer_async(task_name, stop_when=duration_produced)
+        return parse_minutes(await self.get_answer_async(answer, stop_when=duration_produced))
+
+    async def estimate_many(self, task_names, default=60, batch_size=None, max_concurrency=None):
+        batch_size = batch_size or self.batch_size
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        estimates = {}
+        pending = []
+        for name in dict.fromkeys(task_names):
+            cached = await self._cached(name, DEFAULT_SYSTEM_PROMPT, duration_produced)
+            if cached is not None:
+                try:
+                    estimates[name] = parse_minutes(cached)
+                    continue
+                except IndexError:
+                    pass
+            pending.append(name)
+
+        async def estimate_one(name):
+            async with semaphore:
+                try:
+                    estimates[name] = await self.estimate_duration_async(name)
+                except Exception as e:
+                    logging.error(f"Ошибка получения времени выполнения: {e}")
+                    estimates[name] = default
+
+        async def estimate_chunk(chunk):
+            async with semaphore:
+                prompt = "\n".join(f"{i + 1}. {name}" for i, name in enumerate(chunk))
+                try:
+                    answer, _ = await asyncio.wait_for(self._complete_async(prompt, BATCH_SYSTEM_PROMPT),
+                                                       self.answer_timeout)
+                    parsed = parse_batch_minutes(answer, len(chunk))
+                except Exception as e:
+                    logging.error(f"Ошибка пакетной оценки задач: {e}")
+                    parsed = {}
+            missing = []
+            for i, name in enumerate(chunk):
+                if i in parsed:
+                    estimates[name] = parsed[i]
+                    if self.cache is not None:
+                        await self.cache.set(name, DEFAULT_SYSTEM_PROMPT, f"Данная задача займет {parsed[i]} минут.")
+                else:
+                    missing.append(name)
+            await asyncio.gather(*(estimate_one(name) for name in missing))
+
+        if len(pending) == 1:
+            await estimate_one(pending[0])
+        else:
+            chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+            await asyncio.gather(*(estimate_chunk(chunk) for chunk in chunks))
+        return [estimates[name] for name in task_names]
+
+    async def _complete_async(self, user_prompt, system_prompt, stop_when=None):
+        mode = self.completion_mode
+        with llm_seconds.time(stage="total"):
+            if mode in ("sync", "stream") and len(user_prompt) + len(system_prompt) <= self.sync_prompt_limit:
+                try:
+                    with llm_seconds.time(stage=mode):
+                        if mode == "stream":
+                            return await self._complete_stream(user_prompt, system_prompt, stop_when)
+                        return await self._complete_sync(user_prompt, system_prompt), False
+                except (aiohttp.ClientResponseError, KeyError, IndexError, ValueError) as e:
+                    logging.error(f"Ошибка синхронного запроса к YandexGPT, переходим к опросу операции: {e}")
+            return await self._complete_polling(user_prompt, system_prompt), False
+
+    async def _complete_sync(self, user_prompt, system_prompt):
+        session = self._get_session()
+        body = self._build_body(user_prompt, system_prompt)
+        async with session.post(f'{self.api_url}/foundationModels/v1/completion', json=body) as response:
+            response.raise_for_status()
+            data = await response.json()
+        return data['result']['alternatives'][0]['message']['text']
+
+    async def _complete_stream(self, user_prompt, system_prompt, stop_when=None):
+        session = self._get_session()
+        body = self._build_body(user_prompt, system_prompt, stream=True)
+        text = None
+        stopped = False
+        async with session.post(f'{self.api_url}/foundationModels/v1/completion', json=body) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                line = line.strip()
+                if not line:
+                    continue
+                alternative = json.loads(line)['result']['alternatives'][0]
+                text = alternative['message']['text']
+                if alternative.get('status') == 'ALTERNATIVE_STATUS_FINAL':
+                    break
+                if stop_when is not None and stop_when(text):
+                    stopped = True
+                    response.close()
+                    break
+        if text is None:
+            raise ValueError("Пустой ответ потокового запроса")
+        return text, stopped
+
+    async def _complete_polling(self, user_prompt, system_prompt):
+        session = self._get_session()
+        body = self._build_body(user_prompt, system_prompt)
+        with llm_seconds.time(stage="submit"):
+            async with session.post(f'{self.api_url}/foundationModels/v1/completionAsync', json=body) as response:
+                response.raise_for_status()
+                operation_id = (await response.json()).get('id')
+
+        url = f"{self.api_url}/operations/{operation_id}"
+        interval = self.poll_interval
+        with llm_seconds.time(stage="poll"):
+            while True:
+                async with session.get(url) as response:
+                    response.raise_for_status()
+                    data = await response.json()
+                if data.get("done"):
+                    break
+                await asyncio.sleep(interval)
+                interval = min(interval * 1.5, self.max_poll_interval)
+
+        return self._extract_text(data)
 
+    async def close(self):
+        if self.cache is not None:
+            await self.cache.flush()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,27 @@
+import pytest
+
+from asr_backends import ASRBackend, GoogleBackend, StubBackend, get_backend
+from speech2text import SAMPLE_RATE, SAMPLE_WIDTH
+
+
+def test_incomplete_backend_fails_on_creation():
+    class Incomplete(ASRBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_get_backend_falls_back_to_google(monkeypatch):
+    monkeypatch.setenv("ASR_BACKEND", "stub")
+    assert isinstance(get_backend(), StubBackend)
+    assert isinstance(get_backend("unknown"), GoogleBackend)
+
+
+def test_stub_stream_reveals_a_word_per_second():
+    stream = StubBackend("раз два три", delay=0).open_stream()
+    second = bytes(SAMPLE_RATE * SAMPLE_WIDTH)
+    assert stream.accept(second) == "раз"
+    assert stream.accept(second) == "раз два"
+    assert stream.finish() == "раз два три"
+    assert StubBackend("раз", delay=0).open_stream().finish() is None
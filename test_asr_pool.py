@@ -0,0 +1,118 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+from asr_backends import ASRBackend, StubBackend
+from asr_pool import ASRJobInProgress, ASRPool, ASRQueueFull
+from speech2text import SAMPLE_RATE, SAMPLE_WIDTH
+
+
+class EchoBackend(ASRBackend):
+    name = "echo"
+
+    class Stream:
+        def __init__(self):
+            self.chunks = []
+
+        def accept(self, chunk):
+            self.chunks.append(chunk)
+
+        def finish(self):
+            return b"".join(self.chunks).decode()
+
+    def open_stream(self):
+        return self.Stream()
+
+
+async def convert_once():
+    pool = ASRPool(workers=1, backend=EchoBackend())
+    try:
+        future, _ = pool.submit(1, b"a")
+        return await future
+    finally:
+        await pool.close()
+
+
+def convert_in_child():
+    assert asyncio.run(convert_once()) == "a"
+
+
+def test_batch_backend_converts_in_spawned_process(fake_ffmpeg):
+    async def run():
+        pool = ASRPool(workers=1, backend=EchoBackend())
+        try:
+            future, position = pool.submit(1, "посмотреть фильм".encode())
+            return await future, position, pool.stats()
+        finally:
+            await pool.close()
+
+    text, position, stats = asyncio.run(run())
+    assert text == "посмотреть фильм"
+    assert position == 0
+    assert stats["completed"] == 1
+
+
+def test_streaming_backend_reports_partials(fake_ffmpeg):
+    partials = []
+
+    async def on_partial(text):
+        partials.append(text)
+
+    async def run():
+        pool = ASRPool(workers=1, backend=StubBackend("раз два три четыре", delay=0))
+        try:
+            future, _ = pool.submit(1, bytes(3 * SAMPLE_RATE * SAMPLE_WIDTH), on_partial)
+            text = await future
+            await asyncio.sleep(0.05)
+            return text
+        finally:
+            await pool.close()
+
+    assert asyncio.run(run()) == "раз два три четыре"
+    assert partials == ["раз", "раз два", "раз два три"]
+
+
+def test_queue_position_deduplication_and_backpressure(fake_ffmpeg):
+    async def run():
+        pool = ASRPool(workers=1, max_queue=2, backend=EchoBackend())
+        try:
+            first, first_position = pool.submit(1, b"a")
+            with pytest.raises(ASRJobInProgress):
+                pool.submit(1, b"b")
+            second, second_position = pool.submit(2, b"c")
+            with pytest.raises(ASRQueueFull):
+                pool.submit(3, b"d")
+            return await first, await second, first_position, second_position, pool.stats()
+        finally:
+            await pool.close()
+
+    first, second, first_position, second_position, stats = asyncio.run(run())
+    assert (first, second) == ("a", "c")
+    assert (first_position, second_position) == (0, 1)
+    assert stats["deduplicated"] == 1 and stats["rejected"] == 1 and stats["in_flight"] == 0
+
+
+def test_failed_conversion_is_reported(fake_ffmpeg):
+    fake_ffmpeg.write_text("#!/bin/sh\nexit 1\n")
+
+    async def run():
+        pool = ASRPool(workers=1, backend=EchoBackend())
+        try:
+            future, _ = pool.submit(1, b"a")
+            with pytest.raises(Exception):
+                await future
+            return pool.stats()
+        finally:
+            await pool.close()
+
+    assert asyncio.run(run())["failed"] == 1
+
+
+def test_close_lets_the_owning_process_exit(fake_ffmpeg):
+    process = multiprocessing.get_context("spawn").Process(target=convert_in_child)
+    process.start()
+    process.join(15)
+    if process.is_alive():
+        process.kill()
+    assert process.exitcode == 0
@@ -0,0 +1,67 @@
+import asyncio
+import datetime
+
+import pytest
+
+from callbacks import MAX_LENGTH, CallbackRouter, pack, to_base36, unpack
+
+
+class StubCallbackQuery:
+    def __init__(self, data):
+        self.data = data
+        self.answers = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.answers.append((text, show_alert))
+
+
+class StubState:
+    def __init__(self, state=None):
+        self.state = state
+
+    async def get_state(self):
+        return self.state
+
+
+def test_pack_unpack_round_trip():
+    day = datetime.date(2026, 3, 10)
+    data = pack("e", 123456789, day)
+    assert data == f"e:{to_base36(123456789)}:{to_base36((day - datetime.date(1970, 1, 1)).days)}"
+    tag, _, payload = data.partition(":")
+    assert tag == "e"
+    assert unpack(payload, (int, datetime.date)) == [123456789, day]
+    assert unpack("", ()) == []
+    assert unpack(pack("x", -5)[2:], (int,)) == [-5]
+
+
+def test_pack_rejects_long_data_and_unpack_wrong_arity():
+    with pytest.raises(ValueError):
+        pack("t" * MAX_LENGTH, 1)
+    with pytest.raises(ValueError):
+        unpack("1:2", (int,))
+
+
+def test_router_dispatches_by_tag_and_state():
+    router = CallbackRouter()
+    calls = []
+
+    @router.route("t", int, datetime.date, states=["waiting"])
+    async def toggle(callback_query, state, task_id, day):
+        calls.append((task_id, day))
+
+    async def run():
+        day = datetime.date(2026, 3, 10)
+        await router.dispatch(StubCallbackQuery(pack("t", 7, day)), StubState("waiting"))
+        ignored = StubCallbackQuery(pack("t", 8, day))
+        await router.dispatch(ignored, StubState("other"))
+        unknown = StubCallbackQuery(pack("zz", 1))
+        await router.dispatch(unknown, StubState("waiting"))
+        broken = StubCallbackQuery("t:!!")
+        await router.dispatch(broken, StubState("waiting"))
+        return day, ignored, unknown, broken
+
+    day, ignored, unknown, broken = asyncio.run(run())
+    assert calls == [(7, day)]
+    assert ignored.answers == [(None, False)]
+    assert unknown.answers == [(None, False)]
+    assert broken.answers == [("Неверные данные кнопки.", True)]
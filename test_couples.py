@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+import couples
+
+TIMETABLE = "**Понедельник:** 1. Математика: 8:30–10:00. 2. Физика: 10:10–11:40.\n**Среда:** 1. История: 12:00–13:30."
+
+
+@pytest.fixture
+def couples_file(tmp_path, monkeypatch):
+    path = tmp_path / "couples.txt"
+    path.write_text(TIMETABLE, encoding="utf-8")
+    monkeypatch.setattr(couples, "COUPLES_FILE", str(path))
+    monkeypatch.setattr(couples, "RELOAD_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(couples, "_timetable", None)
+    monkeypatch.setattr(couples, "_mtime", None)
+    return path
+
+
+def touch(path, offset):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + offset))
+
+
+def test_timetable_is_compiled_per_weekday(couples_file):
+    timetable = couples.get_timetable()
+    assert timetable.busy[0] == [(8 * 60 + 30, 10 * 60), (10 * 60 + 10, 11 * 60 + 40)]
+    assert timetable.busy[2] == [(12 * 60, 13 * 60 + 30)]
+    assert timetable.labels[2] == ["🔔 История (12:00 - 13:30)"]
+    assert couples.get_timetable() is timetable
+
+
+def test_reload_picks_up_changes(couples_file):
+    first = couples.get_timetable()
+    couples_file.write_text("**Вторник:** 1. Химия: 9:00–10:30.", encoding="utf-8")
+    touch(couples_file, 10 ** 9)
+    second = couples.get_timetable()
+    assert second is not first
+    assert second.busy[1] == [(9 * 60, 10 * 60 + 30)]
+    assert second.busy[0] == []
+
+
+def test_failed_reload_keeps_last_good_timetable(couples_file):
+    good = couples.get_timetable()
+    couples_file.write_bytes(b"\xff\xfe\x00broken")
+    touch(couples_file, 10 ** 9)
+    assert couples.get_timetable() is good
+    couples_file.unlink()
+    assert couples.get_timetable() is good
+
+
+def test_missing_file_on_first_load_gives_empty_timetable(couples_file):
+    couples_file.unlink()
+    assert couples.get_timetable().busy == [[] for _ in couples.WEEKDAYS]
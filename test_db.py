@@ -0,0 +1,53 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+
+def insert(conn, name):
+    return conn.execute("INSERT INTO tasks (user_id, name) VALUES (1, ?) RETURNING id", (name,)).fetchone()[0]
+
+
+def test_concurrent_writes_share_commits(db):
+    async def run():
+        ids = await asyncio.gather(*(db.transaction(lambda conn, i=i: insert(conn, f"задача {i}")) for i in range(50)))
+        rows = await db.fetchall("SELECT id FROM tasks ORDER BY id")
+        return ids, rows
+
+    ids, rows = asyncio.run(run())
+    assert sorted(ids) == [row[0] for row in rows]
+    assert db.stats()["writes"] == 50
+    assert db.stats()["commits"] < 50
+
+
+def test_failed_job_rolls_back_only_itself(db):
+    def broken(conn):
+        insert(conn, "откатится")
+        raise ValueError("сбой")
+
+    async def run():
+        results = await asyncio.gather(db.transaction(lambda conn: insert(conn, "первая")), db.transaction(broken),
+                                       db.transaction(lambda conn: insert(conn, "вторая")), return_exceptions=True)
+        names = await db.fetchall("SELECT name FROM tasks ORDER BY id")
+        return results, names
+
+    results, names = asyncio.run(run())
+    assert isinstance(results[1], ValueError)
+    assert names == [("первая",), ("вторая",)]
+
+
+def test_readers_are_read_only_and_wal(db):
+    async def run():
+        with pytest.raises(sqlite3.OperationalError):
+            await db.fetchall("INSERT INTO tasks (user_id, name) VALUES (1, 'x')")
+        return await db.fetchone("PRAGMA journal_mode")
+
+    assert asyncio.run(run()) == ("wal",)
+
+
+def test_execute_returns_rows(db):
+    async def run():
+        await db.execute("INSERT INTO tasks (user_id, name) VALUES (?, ?)", (7, "a"))
+        return await db.execute("UPDATE tasks SET completed = 1 WHERE user_id = ? RETURNING name", (7,))
+
+    assert asyncio.run(run()) == [("a",)]
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from estimate_cache import EstimateCache, normalize_task_name
+
+
+def test_normalize_task_name():
+    assert normalize_task_name("  Купить   Хлеб!! ") == "купить хлеб"
+    assert EstimateCache.make_key("Купить хлеб", "p") == EstimateCache.make_key("купить  хлеб.", "p")
+
+
+def test_get_reads_through_memory_and_database_without_writing(db):
+    async def run():
+        cache = EstimateCache(db)
+        assert await cache.get("хлеб", "p") is None
+        await cache.set("хлеб", "p", "10 минут")
+        writes = db.writes
+        assert await cache.get("хлеб", "p") == "10 минут"
+        assert await EstimateCache(db).get("хлеб", "p") == "10 минут"
+        assert db.writes == writes
+        return cache.stats()
+
+    stats = asyncio.run(run())
+    assert stats["hits"] == 1 and stats["memory_hits"] == 1 and stats["misses"] == 1
+    assert stats["pending_touches"] == 1
+
+
+def test_expired_entries_are_misses(db):
+    async def run():
+        cache = EstimateCache(db, ttl=60)
+        await cache.set("хлеб", "p", "10 минут")
+        await db.execute("UPDATE estimate_cache SET created_at = created_at - 120")
+        fresh = EstimateCache(db, ttl=60)
+        return await fresh.get("хлеб", "p"), fresh.stats()
+
+    answer, stats = asyncio.run(run())
+    assert answer is None
+    assert stats["misses"] == 1
+
+
+def test_eviction_removes_least_recently_used(db):
+    async def run():
+        cache = EstimateCache(db, memory_size=1, max_entries=3)
+        for name in ("a", "b", "c"):
+            await cache.set(name, "p", name)
+            time.sleep(0.01)
+        assert await cache.get("a", "p") == "a"
+        time.sleep(0.01)
+        await cache.set("d", "p", "d")
+        fresh = EstimateCache(db)
+        return [await fresh.get(name, "p") for name in "abcd"], cache.stats()
+
+    answers, stats = asyncio.run(run())
+    assert answers == ["a", None, "c", "d"]
+    assert stats["evictions"] == 1
+    assert stats["size"] == 3
+    assert stats["pending_touches"] == 0
+
+
+def test_flush_writes_touches(db):
+    async def run():
+        cache = EstimateCache(db, touch_batch=2)
+        await cache.set("a", "p", "a")
+        await cache.set("b", "p", "b")
+        before = (await db.fetchone("SELECT MAX(accessed_at) FROM estimate_cache"))[0]
+        time.sleep(0.01)
+        await cache.get("a", "p")
+        await cache.get("a", "p")
+        assert cache.stats()["pending_touches"] == 1
+        await cache.get("b", "p")
+        after = (await db.fetchone("SELECT MIN(accessed_at) FROM estimate_cache"))[0]
+        return before, after, cache.stats()
+
+    before, after, stats = asyncio.run(run())
+    assert after > before
+    assert stats["pending_touches"] == 0
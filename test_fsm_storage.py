@@ -0,0 +1,59 @@
+import asyncio
+
+from db import Database
+from fsm_storage import SQLiteStorage, create_storage
+
+
+def test_state_and_data_are_shared_through_the_database(db):
+    async def run():
+        storage = SQLiteStorage(db)
+        await storage.set_state(chat=1, user=1, state="TaskCreation:waiting_for_task_name")
+        await storage.update_data(chat=1, user=1, task_name="хлеб")
+        other = Database(db.path)
+        try:
+            shared = SQLiteStorage(other)
+            return await shared.get_state(chat=1, user=1), await shared.get_data(chat=1, user=1)
+        finally:
+            other.close()
+
+    assert asyncio.run(run()) == ("TaskCreation:waiting_for_task_name", {"task_name": "хлеб"})
+
+
+def test_concurrent_updates_are_merged(db):
+    async def run():
+        storage = SQLiteStorage(db)
+        await asyncio.gather(*(storage.update_data(chat=1, user=1, **{f"k{i}": i}) for i in range(20)))
+        return await storage.get_data(chat=1, user=1)
+
+    assert asyncio.run(run()) == {f"k{i}": i for i in range(20)}
+
+
+def test_reset_state_removes_the_row(db):
+    async def run():
+        storage = SQLiteStorage(db)
+        await storage.set_state(chat=1, user=1, state="s")
+        await storage.update_data(chat=1, user=1, a=1)
+        await storage.reset_state(chat=1, user=1, with_data=False)
+        kept = await storage.get_data(chat=1, user=1)
+        await storage.reset_state(chat=1, user=1)
+        return kept, await db.fetchall("SELECT * FROM fsm_states")
+
+    assert asyncio.run(run()) == ({"a": 1}, [])
+
+
+def test_expired_state_is_ignored_and_cleaned_up(db):
+    async def run():
+        storage = SQLiteStorage(db, ttl=60, cleanup_interval=0)
+        await storage.set_state(chat=1, user=1, state="s")
+        await db.execute("UPDATE fsm_states SET updated_at = updated_at - 120")
+        state = await storage.get_state(chat=1, user=1, default="none")
+        await storage.set_state(chat=2, user=2, state="s")
+        return state, await db.fetchall("SELECT chat_id FROM fsm_states")
+
+    assert asyncio.run(run()) == ("none", [(2,)])
+
+
+def test_create_storage_backends(db, monkeypatch):
+    assert isinstance(create_storage(db), SQLiteStorage)
+    monkeypatch.setenv("FSM_STORAGE", "memory")
+    assert type(create_storage(db)).__name__ == "MemoryStorage"
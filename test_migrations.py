@@ -0,0 +1,53 @@
+import sqlite3
+
+from db import Database
+from estimate_cache import EstimateCache
+from fsm_storage import SQLiteStorage
+from migrations import LATEST, current_version, migrate
+
+
+def legacy_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE schedule (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, name TEXT, "
+                 "start_time TEXT, end_time TEXT)")
+    conn.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, name TEXT, "
+                 "scheduled_time TEXT)")
+    conn.executemany("INSERT INTO tasks (user_id, name, scheduled_time) VALUES (?, ?, ?)",
+                     [(1, f"задача {i}", f"2026-03-10 {9 + i % 10:02d}:00 - 2026-03-10 {9 + i % 10:02d}:30")
+                      for i in range(2500)] + [(1, "битая", "когда-нибудь")])
+    conn.commit()
+    conn.close()
+
+
+def test_fresh_database_is_migrated_to_latest(tmp_path):
+    db = Database(str(tmp_path / "schedule.db"))
+    assert migrate(db) == LATEST
+    conn = db.connect()
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"schedule", "tasks", "fsm_states", "estimate_cache", "schema_version"} <= tables
+    assert current_version(conn) == LATEST
+    conn.close()
+
+
+def test_legacy_tasks_are_backfilled_and_rerun_is_a_no_op(tmp_path):
+    path = str(tmp_path / "schedule.db")
+    legacy_db(path)
+    db = Database(path)
+    migrate(db)
+    conn = db.connect()
+    applied = conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0]
+    missing = conn.execute("SELECT name FROM tasks WHERE start_at IS NULL").fetchall()
+    first = conn.execute("SELECT start_at, end_at, completed FROM tasks WHERE id = 1").fetchone()
+    migrate(db)
+    assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == applied == LATEST
+    conn.close()
+    assert missing == [("битая",)]
+    assert first[1] - first[0] == 30 and first[2] == 0
+
+
+def test_storage_and_cache_run_no_ddl(tmp_path):
+    path = tmp_path / "schedule.db"
+    db = Database(str(path))
+    SQLiteStorage(db)
+    EstimateCache(db)
+    assert not path.exists()
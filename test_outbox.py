@@ -0,0 +1,112 @@
+import asyncio
+import types
+
+from aiogram.utils.exceptions import RetryAfter
+
+from outbox import Outbox
+
+
+class StubBot:
+    def __init__(self, flood=0):
+        self.flood = flood
+        self.calls = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.flood:
+            self.flood -= 1
+            raise RetryAfter(0)
+        self.calls.append(("send", chat_id, text, kwargs))
+        return text
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        self.calls.append(("edit", chat_id, message_id, text))
+        return text
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append(("delete", chat_id, message_id))
+        return True
+
+
+def test_edits_of_one_message_are_coalesced():
+    async def run():
+        bot = StubBot()
+        outbox = Outbox(bot)
+        first = outbox.edit_text(1, 10, "1%")
+        second = outbox.edit_text(1, 10, "50%")
+        third = outbox.edit_text(1, 10, "100%")
+        results = await asyncio.gather(first, second, third)
+        await outbox.close()
+        return bot, outbox, results
+
+    bot, outbox, results = asyncio.run(run())
+    assert bot.calls == [("edit", 1, 10, "100%")]
+    assert results == ["100%"] * 3
+    assert outbox.stats()["merged"] == 2
+
+
+def test_delete_drops_queued_edit():
+    async def run():
+        bot = StubBot()
+        outbox = Outbox(bot)
+        message = types.SimpleNamespace(chat=types.SimpleNamespace(id=1), message_id=10)
+        await outbox.reply(message, "Обработка...")
+        edit = outbox.edit_text(1, 10, "50%")
+        deleted = await outbox.delete_message(1, 10)
+        await outbox.close()
+        return bot, await edit, deleted
+
+    bot, edited, deleted = asyncio.run(run())
+    assert bot.calls == [("send", 1, "Обработка...", {"reply_to_message_id": 10}), ("delete", 1, 10)]
+    assert edited is None
+    assert deleted is True
+
+
+def test_retry_after_requeues_in_order():
+    async def run():
+        bot = StubBot(flood=1)
+        outbox = Outbox(bot)
+        results = await asyncio.gather(outbox.send_message(1, "a"), outbox.send_message(1, "b"))
+        await outbox.close()
+        return bot, outbox, results
+
+    bot, outbox, results = asyncio.run(run())
+    assert results == ["a", "b"]
+    assert [call[2] for call in bot.calls] == ["a", "b"]
+    assert outbox.stats()["retried"] == 1
+    assert outbox.stats()["pending"] == 0
+
+
+def test_chat_rate_limit_spaces_sends():
+    async def run():
+        bot = StubBot()
+        outbox = Outbox(bot, chat_rate=20, chat_burst=1)
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(*(outbox.send_message(1, str(i)) for i in range(3)))
+        elapsed = asyncio.get_running_loop().time() - started
+        await outbox.close()
+        return elapsed
+
+    assert asyncio.run(run()) >= 0.09
+
+
+def test_global_rate_is_split_across_workers():
+    assert Outbox(StubBot(), global_rate=30, workers=3).global_bucket.rate == 10
+    assert Outbox(StubBot(), global_rate=2, workers=4).global_bucket.capacity == 1
+
+
+def test_idle_refilled_chat_buckets_are_dropped():
+    async def run():
+        bot = StubBot()
+        outbox = Outbox(bot, chat_rate=10, chat_burst=1, sweep_interval=0)
+        await asyncio.gather(*(outbox.send_message(chat_id, "x") for chat_id in range(5)))
+        buckets = outbox.stats()["buckets"]
+        await asyncio.sleep(0.15)
+        await outbox.send_message(99, "x")
+        stats = outbox.stats()
+        await outbox.close()
+        return buckets, stats
+
+    buckets, stats = asyncio.run(run())
+    assert buckets == 5
+    assert stats["buckets"] == 1
+    assert stats["sent"] == 6
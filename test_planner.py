@@ -0,0 +1,44 @@
+import datetime
+
+from planner import Occupancy, parse_items, plan
+from slots import day_bounds, interval_mask
+
+TODAY = datetime.date(2026, 3, 10)
+TOMORROW = TODAY + datetime.timedelta(days=1)
+
+
+def no_couples(day):
+    return 0
+
+
+def test_plan_fills_earliest_deadline_first_and_reports_unplaced():
+    start, _ = day_bounds(TODAY)
+    busy = {TODAY: [(start + 9 * 60, start + 20 * 60)]}
+    items = [("долгая", 240, TOMORROW), ("короткая", 60, TODAY), ("огромная", 20 * 60, TOMORROW)]
+    placed, unplaced = plan(items, Occupancy(busy, no_couples), TODAY)
+    assert placed == [
+        ("короткая", TODAY, start + 20 * 60, start + 21 * 60),
+        ("долгая", TOMORROW, start + 24 * 60 + 9 * 60, start + 24 * 60 + 13 * 60),
+    ]
+    assert unplaced == [("огромная", 20 * 60, TOMORROW)]
+
+
+def test_plan_does_not_overlap_couples_or_other_items():
+    start, _ = day_bounds(TODAY)
+    couples = lambda day: interval_mask(10 * 60, 11 * 60 + 30)
+    placed, _ = plan([("a", 60, TODAY), ("b", 60, TODAY)], Occupancy({}, couples), TODAY)
+    assert [row[2:] for row in placed] == [(start + 9 * 60, start + 10 * 60),
+                                           (start + 11 * 60 + 30, start + 12 * 60 + 30)]
+
+
+def test_occupancy_skips_time_before_now():
+    start, _ = day_bounds(TODAY)
+    occupancy = Occupancy({}, no_couples, now=start + 20 * 60 + 7)
+    assert occupancy.place(30, TODAY, TOMORROW) == start + 20 * 60 + 7
+    assert occupancy.place(240, TODAY, TOMORROW) == start + 24 * 60 + 9 * 60
+
+
+def test_parse_items():
+    items, errors = parse_items("отчёт; 12.03; 90\nкниги; 01.01\n\nбез даты\nноль; 12.03; 0", TODAY)
+    assert items == [("отчёт", 90, datetime.date(2026, 3, 12)), ("книги", None, datetime.date(2027, 1, 1))]
+    assert errors == ["без даты", "ноль; 12.03; 0"]
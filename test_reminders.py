@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from reminders import ReminderScheduler, now_minutes, parse_shard, reminder_text
+
+
+class StubDB:
+    def __init__(self):
+        self.tasks = {}
+
+    async def fetchall(self, sql, params=()):
+        if "json_each" not in sql:
+            return []
+        return [self.tasks[task_id] for task_id in json.loads(params[0]) if task_id in self.tasks]
+
+
+def test_cancelled_and_moved_reminders_are_dropped_lazily():
+    async def run():
+        db = StubDB()
+        sent = []
+
+        async def send(user_id, text):
+            sent.append((user_id, text))
+
+        scheduler = ReminderScheduler(db, send, lead=15)
+        scheduler.start()
+        await asyncio.sleep(0.01)
+        soon = int(now_minutes()) + 2
+        later = int(now_minutes()) + 600
+        db.tasks = {
+            1: (1, 100, "сдать отчёт", soon, soon + 30, 0),
+            2: (2, 100, "отменённая", soon, soon + 30, 0),
+            3: (3, 100, "перенесённая", later, later + 30, 0),
+            4: (4, 100, "сдвинутая в базе", soon + 5, soon + 35, 0),
+            5: (5, 100, "выполненная", soon, soon + 30, 1),
+        }
+        for task_id in db.tasks:
+            scheduler.schedule(task_id, 100, soon)
+        scheduler.cancel(2)
+        scheduler.schedule(3, 100, later)
+        await asyncio.sleep(0.1)
+        stats = scheduler.stats()
+        await scheduler.close()
+        return sent, stats
+
+    sent, stats = asyncio.run(run())
+    assert [user_id for user_id, _ in sent] == [100]
+    assert "сдать отчёт" in sent[0][1]
+    assert stats["fired"] == 1
+    assert stats["skipped"] == 2
+    assert stats["pending"] == 1
+    assert stats["heap"] == 1
+
+
+def test_schedule_ignores_other_shards_and_past_tasks():
+    async def run():
+        scheduler = ReminderScheduler(StubDB(), None, shard=(1, 2))
+        scheduler.start()
+        await asyncio.sleep(0.01)
+        scheduler.schedule(1, 100, int(now_minutes()) + 60)
+        scheduler.schedule(2, 101, int(now_minutes()) - 60)
+        scheduler.schedule(3, 101, int(now_minutes()) + 60)
+        stats = scheduler.stats()
+        await scheduler.close()
+        return stats
+
+    assert asyncio.run(run())["pending"] == 1
+
+
+def test_reminder_text_and_shard():
+    assert reminder_text("чтение", 600, 660, 590).startswith("⏰ Через 10 мин. начнётся задача «чтение»")
+    assert reminder_text("чтение", 600, 660, 600).startswith("⏰ Сейчас начинается")
+    assert parse_shard("2/4") == (2, 4)
+    assert parse_shard(None) == (0, 1)
@@ -0,0 +1,106 @@
+import datetime
+import random
+
+from slots import (MINUTES_PER_DAY, WORK_MASK, day_bitmap, day_bounds, find_slot, format_scheduled_time,
+                   free_minutes, interval_mask, nearest_start, parse_scheduled_time, search_order, slot_starts)
+
+DAY = datetime.date(2026, 3, 10)
+
+
+def bits(mask):
+    return [i for i in range(MINUTES_PER_DAY) if mask >> i & 1]
+
+
+def test_slot_starts_marks_only_runs_long_enough():
+    free = interval_mask(10, 20) | interval_mask(30, 33)
+    assert bits(slot_starts(free, 5)) == list(range(10, 16))
+    assert bits(slot_starts(free, 3)) == list(range(10, 18)) + [30]
+    assert slot_starts(free, 11) == 0
+    assert slot_starts(free, 1) == free
+
+
+def test_nearest_start_picks_closest_and_prefers_later_on_tie():
+    starts = interval_mask(100, 101) | interval_mask(300, 301)
+    assert nearest_start(starts, 150) == 100
+    assert nearest_start(starts, 250) == 300
+    assert nearest_start(starts, 200) == 300
+    assert nearest_start(starts, 300) == 300
+
+
+def test_nearest_start_clamps_preferred_into_day():
+    starts = interval_mask(100, 101) | interval_mask(1000, 1001)
+    assert nearest_start(starts, -30) == 100
+    assert nearest_start(starts, 10 ** 6) == 1000
+    assert nearest_start(0, 500) is None
+
+
+def test_search_order():
+    first, last = DAY - datetime.timedelta(days=2), DAY + datetime.timedelta(days=1)
+    offsets = lambda days: [(day - DAY).days for day in days]
+    assert offsets(search_order(DAY, first, last, "backward")) == [0, -1, -2]
+    assert offsets(search_order(DAY, first, last, "forward")) == [0, 1]
+    assert offsets(search_order(DAY, first, last, "nearest")) == [0, -1, 1, -2]
+
+
+def test_scheduled_time_round_trip():
+    start, end = parse_scheduled_time("2026-03-10 09:30 - 2026-03-10 10:15")
+    assert end - start == 45
+    assert format_scheduled_time(start, end) == "2026-03-10 09:30 - 2026-03-10 10:15"
+
+
+def gap_walk(busy_by_day, couples, target_date, first_date, task_duration):
+    day = target_date
+    while day >= first_date:
+        day_start, _ = day_bounds(day)
+        slots = sorted(busy_by_day.get(day, []) + [(day_start + s, day_start + e) for s, e in couples.get(day, [])])
+        current, work_end = day_start + 9 * 60, day_start + 23 * 60 + 59
+        for start, end in slots:
+            if current + task_duration <= start:
+                return format_scheduled_time(current, current + task_duration).split(" - ")
+            if current < end:
+                current = end
+        if current + task_duration <= work_end:
+            return format_scheduled_time(current, current + task_duration).split(" - ")
+        day -= datetime.timedelta(days=1)
+    return [None, None]
+
+
+def test_find_slot_matches_day_by_day_gap_walk():
+    rng = random.Random(18)
+    first_date = DAY - datetime.timedelta(days=3)
+    for _ in range(500):
+        busy_by_day, couples = {}, {}
+        for offset in range(4):
+            day = first_date + datetime.timedelta(days=offset)
+            day_start, _ = day_bounds(day)
+            for _ in range(rng.randint(0, 8)):
+                start = rng.randrange(MINUTES_PER_DAY)
+                busy_by_day.setdefault(day, []).append(
+                    (day_start + start, day_start + min(MINUTES_PER_DAY, start + rng.randint(1, 300))))
+            for _ in range(rng.randint(0, 3)):
+                start = rng.randrange(8 * 60, 20 * 60)
+                couples.setdefault(day, []).append((start, start + 90))
+        duration = rng.choice([15, 60, 120, 240, 600, 900])
+        couples_by_day = lambda day: day_bitmap(couples.get(day, []))
+        expected = gap_walk(busy_by_day, couples, DAY, first_date, duration)
+        assert list(find_slot(busy_by_day, couples_by_day, DAY, first_date, duration)) == expected
+
+
+def test_find_slot_forward_and_preferred():
+    day_start, _ = day_bounds(DAY)
+    busy_by_day = {DAY: [(day_start, day_start + MINUTES_PER_DAY)]}
+    next_day = DAY + datetime.timedelta(days=1)
+    found = find_slot(busy_by_day, lambda day: 0, DAY, DAY, 60, next_day + datetime.timedelta(days=5), "forward",
+                      preferred=14 * 60)
+    assert found == (f"{next_day} 14:00", f"{next_day} 15:00")
+    assert find_slot(busy_by_day, lambda day: 0, DAY, DAY, 60) == (None, None)
+
+
+def test_find_slot_skips_time_already_passed():
+    day_start, _ = day_bounds(DAY)
+    now = day_start + 20 * 60 + 7
+    yesterday = DAY - datetime.timedelta(days=1)
+    assert find_slot({}, lambda day: 0, DAY, yesterday, 60, now=now) == (f"{DAY} 20:07", f"{DAY} 21:07")
+    assert find_slot({}, lambda day: 0, DAY, yesterday, 240, now=now) == (None, None)
+    assert free_minutes(yesterday, [], 0, now) == 0
+    assert free_minutes(DAY, [], 0) == WORK_MASK
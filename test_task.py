@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+from estimate_cache import EstimateCache
+from task import DEFAULT_SYSTEM_PROMPT, Task, duration_produced, parse_minutes
+
+FULL_ANSWER = "Данная задача займет 45 минут. Хотите изменить?"
+
+
+async def start_task(llm, mode="polling", cache=None):
+    task = Task(cache=cache)
+    task.api_url = await llm.start()
+    task.completion_mode = mode
+    task.poll_interval = 0.01
+    return task
+
+
+def test_polling_answers_do_not_block_each_other(llm):
+    llm.latency = 0.2
+
+    async def run():
+        task = await start_task(llm)
+        try:
+            started = time.monotonic()
+            answers = await asyncio.gather(*(task.get_answer_async(f"задача {i}") for i in range(5)))
+            return answers, time.monotonic() - started
+        finally:
+            await task.close()
+            await llm.close()
+
+    answers, elapsed = asyncio.run(run())
+    assert [parse_minutes(answer) for answer in answers] == [45] * 5
+    assert [mode for mode, _ in llm.requests] == ["polling"] * 5
+    assert elapsed < 0.6
+
+
+def test_estimate_duration_async(llm):
+    async def run():
+        task = await start_task(llm)
+        try:
+            return await task.estimate_duration_async("хлеб")
+        finally:
+            await task.close()
+            await llm.close()
+
+    assert asyncio.run(run()) == 45
+
+
+def test_estimate_many_batches_and_falls_back_per_task(llm, db):
+    llm.answers["1. хлеб\n2. молоко\n3. сыр"] = "1. 30\n2. 90"
+
+    async def run():
+        task = await start_task(llm, cache=EstimateCache(db))
+        try:
+            first = await task.estimate_many(["хлеб", "молоко", "сыр", "хлеб"])
+            requests = len(llm.requests)
+            second = await task.estimate_many(["сыр", "молоко"])
+            return first, second, requests
+        finally:
+            await task.close()
+            await llm.close()
+
+    first, second, requests = asyncio.run(run())
+    assert first == [30, 90, 45, 30]
+    assert second == [45, 90]
+    assert [prompt for _, prompt in llm.requests][0] == "1. хлеб\n2. молоко\n3. сыр"
+    assert len(llm.requests) == requests == 3
+
+
+def test_estimate_many_bounds_concurrency(llm):
+    llm.latency = 0.1
+
+    async def run():
+        task = await start_task(llm)
+        try:
+            started = time.monotonic()
+            estimates = await task.estimate_many(["a", "b", "c", "d"], batch_size=1, max_concurrency=2)
+            return estimates, time.monotonic() - started
+        finally:
+            await task.close()
+            await llm.close()
+
+    estimates, elapsed = asyncio.run(run())
+    assert estimates == [45] * 4
+    assert elapsed >= 0.2
+
+
+def test_sync_and_stream_modes_fall_back_to_polling_for_long_prompts(llm):
+    async def run():
+        answers = []
+        for mode in ("sync", "stream"):
+            task = await start_task(llm, mode)
+            answers.append(await task.get_answer_async("хлеб"))
+            task.sync_prompt_limit = 0
+            answers.append(await task.get_answer_async("хлеб"))
+            await task.close()
+        await llm.close()
+        return answers
+
+    assert asyncio.run(run()) == [FULL_ANSWER] * 4
+    assert [mode for mode, _ in llm.requests] == ["sync", "polling", "stream", "polling"]
+
+
+def test_answer_cut_by_stop_when_is_cached_separately(llm, db):
+    async def run():
+        task = await start_task(llm, "stream", EstimateCache(db))
+        try:
+            partial = await task.get_answer_async("хлеб", stop_when=duration_produced)
+            again = await task.get_answer_async("хлеб", stop_when=duration_produced)
+            requests = len(llm.requests)
+            full = await task.get_answer_async("хлеб")
+            cached_full = await task.cache.get("хлеб", DEFAULT_SYSTEM_PROMPT)
+            return partial, again, requests, full, cached_full
+        finally:
+            await task.close()
+            await llm.close()
+
+    partial, again, requests, full, cached_full = asyncio.run(run())
+    assert partial == again == "Данная задача займет 45 минут."
+    assert requests == 1
+    assert full == cached_full == FULL_ANSWER
+    assert len(llm.requests) == 2
+
+
+def test_duration_produced():
+    assert duration_produced("займет 45 минут")
+    assert not duration_produced("займет 45")
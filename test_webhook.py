@@ -0,0 +1,87 @@
+import asyncio
+import os
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+
+from asr_backends import ASRBackend
+from asr_pool import ASRPool
+from webhook import WebhookIngress, update_user_id
+
+
+class EchoBackend(ASRBackend):
+    name = "echo"
+
+    class Stream:
+        def __init__(self):
+            self.chunks = []
+
+        def accept(self, chunk):
+            self.chunks.append(chunk)
+
+        def finish(self):
+            return b"".join(self.chunks).decode()
+
+    def open_stream(self):
+        return self.Stream()
+
+
+async def recognize(ogg_data):
+    pool = ASRPool(workers=1, backend=EchoBackend())
+    try:
+        future, _ = pool.submit(1, ogg_data)
+        return await future
+    except Exception as e:
+        return f"error: {e}"
+    finally:
+        await pool.close()
+
+
+def echo_worker(index, workers, updates):
+    with open(os.environ["WEBHOOK_TEST_LOG"], "a", encoding="utf-8") as log:
+        log.write(f"asr {asyncio.run(recognize(b'voice'))}\n")
+        while True:
+            data = updates.get()
+            if data is None:
+                break
+            log.write(f"update {data['update_id']}\n")
+
+
+def test_update_user_id():
+    assert update_user_id({"update_id": 1, "message": {"from": {"id": 42}, "chat": {"id": 7}}}) == 42
+    assert update_user_id({"update_id": 2, "callback_query": {"from": {"id": 43}}}) == 43
+    assert update_user_id({"update_id": 3, "my_chat_member": {"chat": {"id": 44}}}) == 44
+    assert update_user_id({"update_id": 5}) == 5
+
+
+def test_workers_can_run_asr_process_pool_and_receive_updates(tmp_path, monkeypatch, fake_ffmpeg):
+    log = tmp_path / "worker.log"
+    monkeypatch.setenv("WEBHOOK_TEST_LOG", str(log))
+    ingress = WebhookIngress(workers=1, secret="s", target=echo_worker)
+
+    async def post_updates():
+        server = TestServer(ingress.make_app("/webhook"))
+        await server.start_server()
+        try:
+            async with ClientSession() as session:
+                statuses = []
+                for update_id, secret in ((1, "s"), (2, "wrong"), (3, "s")):
+                    async with session.post(server.make_url("/webhook"), json={"update_id": update_id},
+                                            headers={"X-Telegram-Bot-Api-Secret-Token": secret}) as response:
+                        statuses.append(response.status)
+                return statuses
+        finally:
+            await server.close()
+
+    ingress.start_workers()
+    processes = list(ingress._processes)
+    try:
+        assert not any(process.daemon for process in processes)
+        statuses = asyncio.run(post_updates())
+    finally:
+        ingress.stop_workers()
+
+    assert [process.exitcode for process in processes] == [0]
+    assert statuses == [200, 403, 200]
+    assert log.read_text(encoding="utf-8").splitlines() == ["asr voice", "update 1", "update 3"]
+    assert ingress.accepted == 2
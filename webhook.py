@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+import migrations
+from db import Database
+
+UPDATE_SOURCES = ("message", "edited_message", "channel_post", "edited_channel_post", "callback_query",
+                  "inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query", "poll_answer",
+                  "my_chat_member", "chat_member", "chat_join_request")
+
+
+def update_user_id(data):
+    for key in UPDATE_SOURCES:
+        item = data.get(key)
+        if item:
+            sender = item.get("from") or item.get("user") or item.get("chat") or {}
+            if "id" in sender:
+                return sender["id"]
+    return data.get("update_id", 0)
+
+
+async def _process_in_order(dp, update, previous):
+    if previous is not None:
+        await asyncio.gather(previous, return_exceptions=True)
+    try:
+        await dp.process_update(update)
+    except Exception as e:
+        logging.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+
+
+async def _serve_shard(updates):
+    from aiogram import Bot, Dispatcher, types
+
+    import main
+
+    Bot.set_current(main.dp.bot)
+    Dispatcher.set_current(main.dp)
+    await main.on_startup(main.dp)
+    loop = asyncio.get_running_loop()
+    tails = {}
+
+    def forget(user_id, task):
+        if tails.get(user_id) is task:
+            del tails[user_id]
+
+    while True:
+        data = await loop.run_in_executor(None, updates.get)
+        if data is None:
+            break
+        user_id = update_user_id(data)
+        task = asyncio.create_task(_process_in_order(main.dp, types.Update(**data), tails.get(user_id)))
+        tails[user_id] = task
+        task.add_done_callback(lambda t, user_id=user_id: forget(user_id, t))
+
+    await asyncio.gather(*tails.values(), return_exceptions=True)
+    await main.on_shutdown(main.dp)
+    await (await main.bot.get_session()).close()
+
+
+def run_worker(index, workers, updates):
+    logging.basicConfig(level=logging.INFO)
+    logging.info(f"Воркер {index} запущен (pid {os.getpid()})")
+    os.environ["BOT_WORKER_SHARD"] = f"{index}/{workers}"
+    if os.getenv("METRICS_PORT"):
+        os.environ["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + 1 + index)
+    asyncio.run(_serve_shard(updates))
+
+
+class WebhookIngress:
+    def __init__(self, workers=None, max_queue=10_000, secret=None, target=run_worker):
+        self.workers = workers or int(os.getenv("BOT_WORKERS", str(os.cpu_count() or 1)))
+        self.max_queue = max_queue
+        self.secret = secret
+        self.target = target
+        self.accepted = 0
+        self.rejected = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = []
+        self._processes = []
+
+    def start_workers(self):
+        for index in range(self.workers):
+            updates = self._context.Queue(self.max_queue)
+            process = self._context.Process(target=self.target, args=(index, self.workers, updates))
+            process.start()
+            self._queues.append(updates)
+            self._processes.append(process)
+
+    def stop_workers(self):
+        for updates in self._queues:
+            updates.put(None)
+        for process in self._processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        self._queues = []
+        self._processes = []
+
+    async def handle(self, request):
+        if self.secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.secret:
+            return web.Response(status=403)
+        data = await request.json()
+        shard = update_user_id(data) % self.workers
+        try:
+            self._queues[shard].put_nowait(data)
+        except queue.Full:
+            self.rejected += 1
+            return web.Response(status=503)
+        self.accepted += 1
+        return web.Response()
+
+    def make_app(self, path):
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        return app
+
+
+async def set_webhook(token, url, secret):
+    from aiogram import Bot
+
+    bot = Bot(token=token)
+    try:
+        await bot.set_webhook(url, secret_token=secret, drop_pending_updates=True)
+    finally:
+        await (await bot.get_session()).close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    path = os.getenv("WEBHOOK_PATH", "/webhook")
+    secret = os.getenv("WEBHOOK_SECRET")
+    ingress = WebhookIngress(secret=secret)
+    migrations.migrate(Database(os.getenv("SCHEDULE_DB", "schedule.db")))
+    webhook_host = os.getenv("WEBHOOK_HOST")
+    if webhook_host:
+        asyncio.run(set_webhook(os.getenv("BOT_TOKEN"), webhook_host.rstrip("/") + path, secret))
+    ingress.start_workers()
+    try:
+        web.run_app(ingress.make_app(path), host=os.getenv("WEBAPP_HOST", "0.0.0.0"),
+                    port=int(os.getenv("WEBAPP_PORT", "8080")))
+    finally:
+        ingress.stop_workers()
+
+
+if __name__ == '__main__':
+    main()